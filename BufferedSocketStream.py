@@ -1,15 +1,91 @@
+import asyncio
+import os
 import socket as sockets
-from typing import Union
+import stat
+import threading
+from typing import Awaitable, Callable, Iterable, Optional, Union
+
+from frame import LENGTH, Frame, decode_frame, decode_length, encode_frame, encode_frames
+
+
+def set_nodelay(socket: sockets.socket):
+    """
+    disable Nagle, a message is one frame written at once so there is nothing to coalesce
+    """
+    if socket.family in (sockets.AF_INET, sockets.AF_INET6):
+        socket.setsockopt(sockets.IPPROTO_TCP, sockets.TCP_NODELAY, 1)
+
+
+class ReceiveBuffer:
+    """
+    preallocated receive buffer with a read and a write offset.
+    data is received straight into the free tail (recv_into) and handed out as memoryview slices,
+    the unread bytes are moved to the front only when the tail is too small for the next receive.
+    a returned slice is only valid until the next receive into the buffer
+    """
+
+    min_receive = 4096  # compact before receiving into a smaller tail than this
+
+    def __init__(self, capacity=64 * 1024):
+        self.data = bytearray(capacity)
+        self.view = memoryview(self.data)
+        self.start = 0  # first unread byte
+        self.end = 0  # first free byte
+
+    def __len__(self):
+        return self.end - self.start
+
+    def writable(self, min_size=1) -> memoryview:
+        """
+        return the free tail of the buffer, at least "min_size" bytes long
+        """
+        min_size = max(min_size, self.min_receive)
+        if len(self.data) - self.end < min_size:
+            unread = self.end - self.start
+            if unread + min_size > len(self.data):
+                # a single message is bigger than the buffer, grow it
+                data = bytearray(max(2 * len(self.data), unread + min_size))
+                data[:unread] = self.view[self.start:self.end]
+                self.data = data
+                self.view = memoryview(data)
+            else:
+                self.view[:unread] = self.view[self.start:self.end]
+            self.start = 0
+            self.end = unread
+        return self.view[self.end:]
+
+    def commit(self, count: int):
+        """
+        mark "count" bytes received into writable() as readable
+        """
+        self.end += count
+
+    def consume(self, count: int) -> memoryview:
+        part = self.view[self.start:self.start + count]
+        self.start += count
+        if self.start == self.end:
+            # nothing left to move on the next compaction
+            self.start = self.end = 0
+        return part
+
+    def clear(self):
+        self.start = self.end = 0
 
 
 class BufferedSocketStream:
     """
     reconnect_attempts set to 0 to disable autoreconnect
+    on_connect is called with the stream after every (re)connect, use it to resend a handshake
     """
 
-    def __init__(self, address: Union[tuple[str, int], int, sockets.socket], reconnect_attempts=0):
+    def __init__(self, address: Union[tuple[str, int], int, sockets.socket], reconnect_attempts=0,
+                 on_connect: Optional[Callable[['BufferedSocketStream'], None]] = None):
         if (isinstance(address, int)):
             address = ('127.0.0.1', address)
+        self.buffer = ReceiveBuffer()
+        self.on_connect = on_connect
+        self.send_lock = threading.Lock()  # held by writers that send a message in several calls
+        self._reconnect_lock = threading.RLock()  # on_connect may fail and reconnect again
         if isinstance(address, tuple):
             self.socket = sockets.create_connection(address)
             self.address = address
@@ -17,56 +93,71 @@ class BufferedSocketStream:
             if reconnect_attempts > 0:
                 reconnect_attempts = 0
             self.socket = address
-        self.buffer = bytearray()
-        self.size = 0
+        set_nodelay(self.socket)
         self.reconnect_attempts = reconnect_attempts
+        if isinstance(address, tuple) and on_connect is not None:
+            on_connect(self)
 
-    def read(self, count) -> bytes:
+    def read(self, count) -> memoryview:
         """
-        block until "count" bytes are available and return them
+        block until "count" bytes are available and return them.
+        the returned view is only valid until the next read, copy it with bytes() to keep it
         """
-        while True:
-            if count <= self.size:
-                part = self.buffer[:count]
-                self.buffer = self.buffer[count:]
-                self.size -= count
-                return part
-
+        while len(self.buffer) < count:
+            socket = self.socket
             try:
-                received = self.socket.recv(64 * 1024)
-                if received == b'':
+                received = socket.recv_into(self.buffer.writable(count - len(self.buffer)))
+                if received == 0:
                     raise ConnectionError("received 0 bytes possibly socket disconnected")
-            except sockets.error or ConnectionError as e:
+            except (sockets.error, ConnectionError) as e:
                 if self.reconnect_attempts > 0:
-                    self.reconnect(cause=e)
+                    self.reconnect(cause=e, failed=socket)
                     continue
                 else:
                     raise e
-
-            self.buffer.extend(received)
-            self.size += len(received)
+            self.buffer.commit(received)
+        return self.buffer.consume(count)
 
     def sendall(self, bytes: bytes):
         while True:
+            socket = self.socket
             try:
-                return self.socket.sendall(bytes)
+                return socket.sendall(bytes)
             except sockets.error as e:
                 if self.reconnect_attempts > 0:
-                    self.reconnect(cause=e)
+                    self.reconnect(cause=e, failed=socket)
                     continue
                 else:
                     raise e
 
-    def reconnect(self, cause: BaseException):
-        attempts = self.reconnect_attempts
-        while True:
+    def reconnect(self, cause: BaseException, failed: Optional[sockets.socket] = None):
+        """
+        replace the socket with a new connection to the same address.
+        when "failed" is given and another thread already replaced that socket this does nothing,
+        so a reader and a writer that fail at the same time only reconnect once
+        """
+        with self._reconnect_lock:
+            if failed is not None and self.socket is not failed:
+                return
+            attempts = self.reconnect_attempts
+            while True:
+                try:
+                    socket = sockets.create_connection(self.address)
+                    set_nodelay(socket)
+                    break
+                except sockets.error as e:
+                    attempts = attempts - 1
+                    if attempts == 0:
+                        raise ConnectionError(f"attempted to reconnect {self.reconnect_attempts} but address did not respond, cause of reconnect: {str(cause)}") from e
             try:
-                self.socket = sockets.create_connection(self.address)
-                break
-            except sockets.error as e:
-                attempts = attempts - 1
-                if attempts == 0:
-                    raise ConnectionError(f"attempted to reconnect {self.reconnect_attempts} but address did not respond, cause of reconnect: {str(cause)}") from e
+                self.socket.close()
+            except sockets.error:
+                pass
+            self.socket = socket
+            # bytes buffered from the old connection belong to a message that will never complete
+            self.buffer.clear()
+            if self.on_connect is not None:
+                self.on_connect(self)
 
     def read_int32(self):
         return int.from_bytes(self.read(8), byteorder='little')
@@ -77,7 +168,7 @@ class BufferedSocketStream:
     # read length then read bytes
     def read_utf8(self):
         len = self.read_int32()
-        return self.read(len).decode('utf-8')
+        return str(self.read(len), 'utf-8')
 
     # send length then send bytes
     def send_utf8(self, s: str):
@@ -85,6 +176,18 @@ class BufferedSocketStream:
         self.send_int32(len(buf))
         self.sendall(buf)
 
+    def read_frame(self) -> Frame:
+        return decode_frame(self.read(decode_length(self.read(LENGTH.size))))
+
+    def send_frame(self, frame: Frame):
+        self.sendall(encode_frame(frame))
+
+    def send_frames(self, frames: Iterable[Frame]):
+        """
+        send several frames with a single sendall
+        """
+        self.sendall(encode_frames(frames))
+
     def close(self):
         self.socket.close()
 
@@ -99,3 +202,196 @@ class BufferedSocketStream:
         if exc_type is not None:
             return False  # exception happened
         return True
+
+
+class AsyncBufferedSocketStream(asyncio.BufferedProtocol):
+    """
+    asyncio version of BufferedSocketStream for nodes that run on an event loop.
+    it is its own protocol: the transport receives straight into a ReceiveBuffer (recv_into)
+    and reads return memoryview slices of it, valid until the next read.
+    sends are buffered by the transport and flushed by awaiting drain()
+    """
+
+    high_water = 1024 * 1024  # stop reading from the socket above this many unread bytes
+
+    def __init__(self, on_connected: Optional[Callable[['AsyncBufferedSocketStream'], Awaitable[None]]] = None):
+        self.buffer = ReceiveBuffer()
+        self.transport: Optional[asyncio.Transport] = None
+        self.on_connected = on_connected
+        self.address = None
+        self._needed = 0  # bytes the pending reader waits for
+        self._read_waiter: Optional[asyncio.Future] = None
+        self._drain_waiter: Optional[asyncio.Future] = None
+        self._write_paused = False
+        self._read_paused = False
+        self._closed_exc: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def connect(cls, address: Union[tuple[str, int], int, str]) -> 'AsyncBufferedSocketStream':
+        """
+        a port or (host, port) connects over TCP, a str is the path of a unix socket
+        """
+        if isinstance(address, int):
+            address = ('127.0.0.1', address)
+        if isinstance(address, str):
+            _, stream = await asyncio.get_running_loop().create_unix_connection(cls, address)
+        else:
+            _, stream = await asyncio.get_running_loop().create_connection(cls, *address)
+        stream.address = address
+        return stream
+
+    # protocol callbacks, called by the event loop
+
+    def connection_made(self, transport):
+        self.transport = transport
+        socket = transport.get_extra_info('socket')
+        if socket is not None:
+            set_nodelay(socket)
+        if self.on_connected is not None:
+            # keep a reference, the loop only keeps weak references to tasks
+            self._task = asyncio.get_running_loop().create_task(self.on_connected(self))
+
+    def get_buffer(self, sizehint):
+        return self.buffer.writable(self._needed - len(self.buffer))
+
+    def buffer_updated(self, nbytes):
+        self.buffer.commit(nbytes)
+        if self._read_waiter is not None and len(self.buffer) >= self._needed:
+            self._wake(self._read_waiter)
+            self._read_waiter = None
+        if len(self.buffer) > self.high_water and not self._read_paused:
+            self._read_paused = True
+            self.transport.pause_reading()
+
+    def eof_received(self):
+        self.connection_lost(None)
+        return False
+
+    def connection_lost(self, exc):
+        if self._closed_exc is None:
+            self._closed_exc = ConnectionError(f"socket disconnected{f': {exc}' if exc else ''}")
+        for waiter in (self._read_waiter, self._drain_waiter):
+            self._wake(waiter)
+        self._read_waiter = self._drain_waiter = None
+
+    def pause_writing(self):
+        self._write_paused = True
+
+    def resume_writing(self):
+        self._write_paused = False
+        self._wake(self._drain_waiter)
+        self._drain_waiter = None
+
+    @staticmethod
+    def _wake(waiter: Optional[asyncio.Future]):
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    # stream api
+
+    async def read(self, count) -> memoryview:
+        """
+        wait until "count" bytes are available and return them
+        """
+        while len(self.buffer) < count:
+            if self._closed_exc is not None:
+                raise ConnectionError(f"received {len(self.buffer)} of {count} bytes possibly socket disconnected") from self._closed_exc
+            self._needed = count
+            self._read_waiter = asyncio.get_running_loop().create_future()
+            if self._read_paused:
+                self._read_paused = False
+                self.transport.resume_reading()
+            await self._read_waiter
+        self._needed = 0
+        return self.buffer.consume(count)
+
+    def sendall(self, bytes: bytes):
+        if self._closed_exc is not None:
+            raise self._closed_exc
+        self.transport.write(bytes)
+
+    async def drain(self):
+        if self._closed_exc is not None:
+            raise self._closed_exc
+        if self._write_paused:
+            self._drain_waiter = asyncio.get_running_loop().create_future()
+            await self._drain_waiter
+            if self._closed_exc is not None:
+                raise self._closed_exc
+
+    async def read_int32(self):
+        return int.from_bytes(await self.read(8), byteorder='little')
+
+    def send_int32(self, n: int):
+        self.sendall(n.to_bytes(length=8, byteorder='little'))
+
+    async def read_frame(self) -> Frame:
+        return decode_frame(await self.read(decode_length(await self.read(LENGTH.size))))
+
+    def send_frame(self, frame: Frame):
+        self.sendall(encode_frame(frame))
+
+    def send_frames(self, frames: Iterable[Frame]):
+        """
+        send several frames with a single write
+        """
+        self.sendall(encode_frames(frames))
+
+    # read length then read bytes
+    async def read_utf8(self):
+        len = await self.read_int32()
+        return str(await self.read(len), 'utf-8')
+
+    # send length then send bytes
+    def send_utf8(self, s: str):
+        buf = s.encode('utf-8')
+        self.send_int32(len(buf))
+        self.sendall(buf)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        try:
+            self.close()
+        except Exception as e:
+            print("error closing socket", e)
+        if exc_type is not None:
+            return False  # exception happened
+        return True
+
+
+async def start_server(on_connected: Callable[[AsyncBufferedSocketStream], Awaitable[None]], host: str, port: int,
+                       backlog=100) -> asyncio.AbstractServer:
+    """
+    asyncio.start_server for AsyncBufferedSocketStream, on_connected is run as a task for every accepted connection
+    """
+    return await asyncio.get_running_loop().create_server(lambda: AsyncBufferedSocketStream(on_connected),
+                                                          host=host, port=port, backlog=backlog)
+
+
+def remove_stale_socket(path: str):
+    """
+    a unix socket file outlives the process that listened on it if it died, binding again fails until it is removed
+    """
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+async def start_unix_server(on_connected: Callable[[AsyncBufferedSocketStream], Awaitable[None]], path: str,
+                            backlog=100, stream_class=AsyncBufferedSocketStream) -> asyncio.AbstractServer:
+    """
+    start_server on a unix socket, for peers on the same host: no TCP/IP stack on the way.
+    a stale socket file at "path" is replaced, the caller removes the file once the server is closed
+    """
+    remove_stale_socket(path)
+    return await asyncio.get_running_loop().create_unix_server(lambda: stream_class(on_connected), path=path,
+                                                               backlog=backlog)
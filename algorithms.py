@@ -0,0 +1,741 @@
+import heapq
+import math
+import struct
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple, Type
+
+from cli_io import IO
+from frame import Frame
+
+MESSAGE_TYPE_PERMISSION_REQUEST = 1
+MESSAGE_TYPE_PERMISSION_GRANTED = 2  # maekawa: LOCKED
+MESSAGE_TYPE_FAILED = 3
+MESSAGE_TYPE_INQUIRE = 4
+MESSAGE_TYPE_YIELD = 5  # maekawa: RELINQUISH
+MESSAGE_TYPE_RELEASE = 6
+MESSAGE_TYPE_TOKEN = 7
+
+MESSAGE_TYPE_NAMES = {MESSAGE_TYPE_PERMISSION_REQUEST: 'request', MESSAGE_TYPE_PERMISSION_GRANTED: 'granted',
+                      MESSAGE_TYPE_FAILED: 'failed', MESSAGE_TYPE_INQUIRE: 'inquire', MESSAGE_TYPE_YIELD: 'yield',
+                      MESSAGE_TYPE_RELEASE: 'release', MESSAGE_TYPE_TOKEN: 'token'}
+
+# flags of a PERMISSION_REQUEST
+FLAG_SHARED = 1  # a read request, compatible with the other read requests
+
+
+class MutexAlgorithm:
+    """
+    the protocol state of one node, independent of the transport.
+    all methods are called from a single thread (the node's event loop), messages go out through
+    send(peer, frame) which must not block, and entered() is called once the node may enter
+    the critical section (possibly from inside request()).
+    one instance guards one named lock ("key"), every frame it sends carries that key.
+    on_peer_down()/on_peer_up() tell it which peers the failure detector suspects, a node that is only
+    unreachable but still alive may then be inside the critical section at the same time.
+    add_peer()/remove_peer() tell it about nodes joining and leaving the cluster.
+    an instance that is idle() may be dropped and the key started again later by a new instance, see resume()
+    """
+    name = ''
+    supports_shared = False  # whether request(shared=True) is implemented
+    supports_membership_changes = False  # whether add_peer()/remove_peer() are implemented
+    # whether queue_length() counts every other node waiting for the critical section while we are in it
+    sees_remote_waiters = True
+
+    def __init__(self, node_id: int, peers: List[int], send: Callable[[int, Frame], None], entered: Callable[[], None], log: IO,
+                 key=''):
+        self.key = key
+        self.node_id = node_id
+        self.peers = peers
+        self.send = send
+        self.entered = entered
+        self.log = log
+        self.h = 0  # lamport clock
+        self.requesting = False
+        self.in_cs = False
+        self.down: Set[int] = set()  # peers suspected to have failed
+
+    def frame(self, message_type: int, clock: int, payload=b'', flags=0) -> Frame:
+        return Frame(message_type, sender=self.node_id, clock=clock, payload=payload, flags=flags, key=self.key)
+
+    def can_enter_without_messages(self) -> bool:
+        return False
+
+    def request(self, shared=False) -> None:
+        """
+        ask for the critical section, "shared" asks for read access that other readers may hold at the same time
+        """
+        raise NotImplementedError
+
+    def release(self) -> None:
+        """
+        leave the critical section, or withdraw a request that did not enter yet
+        """
+        raise NotImplementedError
+
+    def on_message(self, sender: int, frame: Frame) -> None:
+        raise NotImplementedError
+
+    def missing(self) -> List[int]:
+        """
+        the nodes a pending request still waits for
+        """
+        return []
+
+    def queue_length(self) -> int:
+        """
+        the requests of other nodes this node is holding back
+        """
+        return 0
+
+    def on_peer_down(self, node: int) -> None:
+        self.down.add(node)
+
+    def on_peer_up(self, node: int) -> None:
+        self.down.discard(node)
+
+    def waits_for_down(self) -> List[int]:
+        """
+        the suspected nodes the pending request can't be granted without
+        """
+        return [p for p in self.missing() if p in self.down]
+
+    def add_peer(self, node: int) -> None:
+        """
+        "node" joined the cluster
+        """
+        raise NotImplementedError
+
+    def remove_peer(self, node: int) -> None:
+        """
+        "node" left the cluster, it holds nothing and will not ask again
+        """
+        raise NotImplementedError
+
+    def idle(self) -> bool:
+        """
+        whether the instance holds nothing a new one would not start with: no request, no critical section,
+        nothing deferred or queued, no permission or token
+        """
+        return False
+
+    def grants(self) -> int:
+        """
+        the highest count of permissions given to one node, only kept by algorithms that tag their grants
+        """
+        return 0
+
+    def resume(self, h: int, grants: int) -> None:
+        """
+        start from dropped idle instances of the key: at least their clock and grant counts, so that frames
+        still in flight for them are not taken for answers to our requests
+        """
+        self.h = max(self.h, h)
+
+
+class RicartAgrawala(MutexAlgorithm):
+    """
+    every request needs a permission-reply from every other node, 2(N-1) messages per entry.
+    a request is exclusive (write) or shared (read): a node that is reading or waiting to read
+    answers read requests right away, so any number of readers can be in at once
+    """
+    name = 'ricart_agrawala'
+    supports_shared = True
+    supports_membership_changes = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shared = False  # mode of our pending or current request
+        self.last_request_h = 0
+        self.waiting_nodes: List[Tuple[int, int]] = []  # (node, h of its request)
+        self.aquired_permissions: Set[int] = set()
+        self.peer_set: Set[int] = set(self.peers)
+        # len(missing_permissions()), kept up to date so that a permission is counted in O(1)
+        self.missing_count = len(self.peer_set)
+
+    def can_enter_without_messages(self) -> bool:
+        return not self.requesting and not self.in_cs and self.missing_count == 0
+
+    def missing_permissions(self) -> List[int]:
+        return [p for p in self.peers if p not in self.aquired_permissions and p not in self.down]
+
+    def count_missing(self):
+        # O(N), only when the set of peers or of suspected peers changes, and once per request
+        self.missing_count = sum(1 for p in self.peers if p not in self.aquired_permissions and p not in self.down)
+
+    def add_permission(self, node: int):
+        if node not in self.aquired_permissions:
+            self.aquired_permissions.add(node)
+            if node in self.peer_set and node not in self.down:
+                self.missing_count -= 1
+
+    def discard_permission(self, node: int):
+        if node in self.aquired_permissions:
+            self.aquired_permissions.discard(node)
+            if node in self.peer_set and node not in self.down:
+                self.missing_count += 1
+
+    def missing(self) -> List[int]:
+        return self.missing_permissions() if self.requesting else []
+
+    def queue_length(self) -> int:
+        return sum(1 for p, _ in self.waiting_nodes if p not in self.down)
+
+    def idle(self) -> bool:
+        return not self.requesting and not self.in_cs and not self.waiting_nodes
+
+    def on_peer_down(self, node: int):
+        # a dead node does not answer, we stop waiting for it. its deferred request stays: a node that was
+        # only suspected for a while still needs our permission, the one sent to a dead node is dropped
+        super().on_peer_down(node)
+        self.count_missing()
+        self.check_permissions()
+
+    def on_peer_up(self, node: int):
+        super().on_peer_up(node)
+        self.count_missing()
+        if self.requesting and node not in self.aquired_permissions:
+            self.ask([node])
+
+    def add_peer(self, node: int):
+        if node == self.node_id or node in self.peers:
+            return
+        self.peers.append(node)
+        self.peer_set.add(node)
+        self.count_missing()
+        if self.requesting:
+            # it may have a request older than ours that we did not wait for, it must answer ours too
+            self.ask([node])
+
+    def remove_peer(self, node: int):
+        if node not in self.peers:
+            return
+        self.on_peer_down(node)
+        self.waiting_nodes = [(p, h) for p, h in self.waiting_nodes if p != node]
+        self.peers.remove(node)
+        self.peer_set.discard(node)
+        self.down.discard(node)
+        self.aquired_permissions.discard(node)
+        self.count_missing()
+
+    def request(self, shared=False):
+        self.h = self.h + 1
+        self.last_request_h = self.h
+        self.shared = shared
+        self.requesting = True
+        self.aquired_permissions.clear()
+        self.count_missing()
+        self.ask(self.peers)
+
+    def ask(self, nodes: List[int]):
+        if nodes:
+            self.log.debug("will send MESSAGE(type=PERMISSION_REQUEST, port=%s, h=%s, shared=%s) to nodes %s", self.node_id, self.last_request_h, self.shared, nodes)
+            self.log.debug('Waiting for permission-replies')
+        flags = FLAG_SHARED if self.shared else 0
+        for p in nodes:
+            self.send(p, self.frame(MESSAGE_TYPE_PERMISSION_REQUEST, self.last_request_h,
+                                    payload=self.request_payload(p), flags=flags))
+        self.check_permissions()
+
+    def request_payload(self, node: int) -> bytes:
+        return b''
+
+    def check_permissions(self):
+        if self.requesting and self.missing_count == 0:
+            self.requesting = False
+            self.in_cs = True
+            self.entered()
+
+    def release(self):
+        self.requesting = False
+        self.in_cs = False
+        self.log.debug('resoure released')
+        self.log.debug('will send PERMISSION_GRANTED to waiting nodes (%s)', len(self.waiting_nodes))
+        waiting_nodes, self.waiting_nodes = self.waiting_nodes, []
+        for p, h in waiting_nodes:
+            self.grant(p, h)
+        self.released()
+
+    def released(self):
+        self.aquired_permissions.clear()
+        self.count_missing()
+
+    def grant(self, node: int, h: int):
+        self.log.debug("will send MESSAGE(type=PERMISSION_GRANTED, port=%s, h=%s) to node %s", self.node_id, h, node)
+        self.send(node, self.frame(MESSAGE_TYPE_PERMISSION_GRANTED, h))
+
+    def has_priority_over(self, node: int, h: int, shared=False) -> bool:
+        """
+        whether our pending or current request goes before the request (node, h).
+        two reads never exclude each other
+        """
+        if shared and self.shared:
+            return False
+        return self.in_cs or (self.requesting and (self.last_request_h, self.node_id) < (h, node))
+
+    def on_message(self, sender: int, frame: Frame):
+        if frame.type == MESSAGE_TYPE_PERMISSION_REQUEST:
+            incoming_h = frame.clock
+            self.h = max(self.h, incoming_h)
+            shared = bool(frame.flags & FLAG_SHARED)
+            self.log.debug("[handler for %s] got MESSAGE(type=PERMISSION_REQUEST, port=%s, incoming_h=%s, shared=%s) from node %s", sender, sender, incoming_h, shared, sender)
+            if self.has_priority_over(sender, incoming_h, shared):
+                self.log.debug("[handler for %s] adding %s to wainting list", sender, sender)
+                self.waiting_nodes.append((sender, incoming_h))
+            else:
+                self.on_request_granted(sender, incoming_h)
+        elif frame.type == MESSAGE_TYPE_PERMISSION_GRANTED:
+            self.log.debug("[handler for %s] got MESSAGE(type=PERMISSION_GRANTED, port=%s, h=%s) from node %s", sender, sender, frame.clock, sender)
+            self.on_permission(sender, frame.clock)
+        else:
+            self.log.debug("[handler for %s] got unkown message type: %s", sender, frame.type)
+
+    def on_request_granted(self, node: int, h: int):
+        self.grant(node, h)
+
+    def on_permission(self, node: int, h: int):
+        if not self.requesting or h != self.last_request_h:
+            # late reply to a request that timed out
+            self.log.debug("[handler for %s] ignoring permission for old request h=%s", node, h)
+            return
+        self.add_permission(node)
+        self.check_permissions()
+
+
+class RoucairolCarvalho(RicartAgrawala):
+    """
+    Ricart & Agrawala where a permission stays valid until the node that gave it asks for the resource.
+    a node only asks the nodes it gave its own permission to since its last entry, so a node
+    that enters again without anyone else asking in between sends no messages at all.
+    a request carries how many times we gave the asked node our permission so far and its grant echoes
+    that count: a grant sent before we gave the permission away again is stale and dropped, also when
+    the links reorder messages
+    """
+    name = 'roucairol_carvalho'
+    # a permission given to a reader because we were reading too does not exclude our later writes
+    supports_shared = False
+
+    GRANTS = struct.Struct('<Q')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.grants_to: Dict[int, int] = {}  # how many times we gave every node our permission
+        # the count in the requests (node, h) we did not answer yet, echoed by our grant
+        self.grants_asked: Dict[Tuple[int, int], int] = {}
+        self.grants_base = 0  # the count of a node we did not give our permission to yet
+
+    def idle(self) -> bool:
+        # the permissions we hold are lost with the instance, so it is only idle once it gave them all away
+        return super().idle() and not self.aquired_permissions and not self.grants_asked
+
+    def grants(self) -> int:
+        return max(self.grants_to.values(), default=self.grants_base)
+
+    def resume(self, h: int, grants: int):
+        super().resume(h, grants)
+        # a stale grant echoes a count below the one the dropped instance reached
+        self.grants_base = max(self.grants_base, grants)
+
+    def decode_grants(self, payload: bytes) -> int:
+        return self.GRANTS.unpack_from(payload)[0] if len(payload) >= self.GRANTS.size else 0
+
+    def request_payload(self, node: int) -> bytes:
+        return self.GRANTS.pack(self.grants_to.get(node, self.grants_base))
+
+    def on_message(self, sender: int, frame: Frame):
+        if frame.type == MESSAGE_TYPE_PERMISSION_REQUEST:
+            # a request asked again after its node gave us its permission carries a higher count
+            request = (sender, frame.clock)
+            self.grants_asked[request] = max(self.grants_asked.get(request, 0), self.decode_grants(frame.payload))
+        elif frame.type == MESSAGE_TYPE_PERMISSION_GRANTED and \
+                self.decode_grants(frame.payload) != self.grants_to.get(sender, self.grants_base):
+            self.log.debug("[handler for %s] ignoring permission sent before we gave it back", sender)
+            return
+        super().on_message(sender, frame)
+
+    def request(self, shared=False):
+        self.h = self.h + 1
+        self.last_request_h = self.h
+        self.requesting = True
+        self.ask(self.missing_permissions())
+
+    def on_request_granted(self, node: int, h: int):
+        self.grant(node, h)
+        if self.requesting:
+            # it goes first, we gave our permission away and need it back
+            self.ask([node])
+
+    def released(self):
+        # the deferred nodes got their permission in release(), the others are still ours
+        pass
+
+    def grant(self, node: int, h: int):
+        self.log.debug("will send MESSAGE(type=PERMISSION_GRANTED, port=%s, h=%s) to node %s", self.node_id, h, node)
+        self.send(node, self.frame(MESSAGE_TYPE_PERMISSION_GRANTED, h,
+                                   payload=self.GRANTS.pack(self.grants_asked.pop((node, h), 0))))
+        self.discard_permission(node)
+        self.grants_to[node] = self.grants_to.get(node, self.grants_base) + 1
+
+    def on_permission(self, node: int, h: int):
+        # a permission that is not stale (see on_message) stays valid whatever request it answered
+        self.add_permission(node)
+        self.check_permissions()
+
+    def remove_peer(self, node: int):
+        super().remove_peer(node)
+        self.grants_to.pop(node, None)
+        self.grants_asked = {request: count for request, count in self.grants_asked.items() if request[0] != node}
+
+
+def grid_quorum(node_id: int, nodes: List[int]) -> List[int]:
+    """
+    place the sorted node ids row by row in a grid of ceil(sqrt(N)) columns, the quorum of a node is
+    its row plus its column (about 2*sqrt(N) nodes). any two quorums share at least one node,
+    also when the last row is not full, since every column has a node in each full row
+    """
+    nodes = sorted(nodes)
+    columns = math.ceil(math.sqrt(len(nodes)))
+    index = nodes.index(node_id)
+    row, column = divmod(index, columns)
+    quorum = set(nodes[row * columns:(row + 1) * columns]) | set(nodes[column::columns])
+    return sorted(quorum)
+
+
+class Maekawa(MutexAlgorithm):
+    """
+    Maekawa's algorithm: a node only needs the permission (LOCKED) of the nodes in its quorum,
+    a grid row plus column of about 2*sqrt(N) nodes, and every node arbitrates for the quorums it is in.
+    an arbiter locks for one request at a time, deadlocks between requests that each hold part of
+    their quorum are broken with INQUIRE/YIELD: an arbiter that gets a request older than the one
+    it locked for asks the holder to give the lock back, which it does once it knows it can't
+    enter yet (it got a FAILED). all nodes must know the same node ids.
+    messages between two nodes must arrive in the order they were sent, as they do over one TCP connection:
+    a RELEASE that arrives ahead of the REQUEST it ends leaves the arbiter locked for a request that is
+    already gone, and the nodes queued behind it wait forever
+    """
+    name = 'maekawa'
+    # the requests of the other nodes wait at the arbiters of their own quorum, only a few of them queue here
+    sees_remote_waiters = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.quorum = grid_quorum(self.node_id, self.peers + [self.node_id])
+        self.last_request_h = 0
+        # as requester
+        self.locks: Set[int] = set()  # arbiters that locked for our request
+        self.failed: Set[int] = set()  # arbiters that told us an older request goes first
+        self.yielded: Set[int] = set()  # arbiters we gave the lock back to
+        self.inquiries: Set[int] = set()  # arbiters that want their lock back, answered once we fail
+        # as arbiter
+        self.locked_for: Optional[Tuple[int, int]] = None  # (h, node)
+        self.queue: List[Tuple[int, int]] = []  # heap of (h, node)
+        self.inquired = False
+        self._local: Deque[Tuple[int, Frame]] = deque()  # messages to ourselves, handled in order
+        self._delivering = False
+
+    def can_enter_without_messages(self) -> bool:
+        return not self.requesting and not self.in_cs and self.quorum == [self.node_id]
+
+    def missing(self) -> List[int]:
+        return [p for p in self.quorum if p not in self.locks] if self.requesting else []
+
+    def queue_length(self) -> int:
+        return len(self.queue)
+
+    def idle(self) -> bool:
+        return not self.requesting and not self.in_cs and self.locked_for is None and not self.queue and not self._local
+
+    def on_peer_down(self, node: int):
+        # as arbiter, a dead node gives its lock back and leaves the queue. as requester we can't do
+        # without a quorum member, the pending request shows it in waits_for_down()
+        super().on_peer_down(node)
+        queued = [request for request in self.queue if request[1] != node]
+        if len(queued) != len(self.queue):
+            self.queue = queued
+            heapq.heapify(self.queue)
+        if self.locked_for is not None and self.locked_for[1] == node:
+            self.lock_next()
+
+    def post(self, node: int, message_type: int, h: int):
+        frame = self.frame(message_type, h)
+        if node != self.node_id:
+            self.send(node, frame)
+            return
+        # we are in our own quorum, handle it here without re-entering a handler that is still running
+        self._local.append((node, frame))
+        if self._delivering:
+            return
+        self._delivering = True
+        try:
+            while self._local:
+                self.on_message(*self._local.popleft())
+        finally:
+            self._delivering = False
+
+    def request(self, shared=False):
+        self.h = self.h + 1
+        self.last_request_h = self.h
+        self.requesting = True
+        self.locks.clear()
+        self.failed.clear()
+        self.yielded.clear()
+        self.inquiries.clear()
+        self.log.debug("will send MESSAGE(type=PERMISSION_REQUEST, port=%s, h=%s) to quorum %s", self.node_id, self.h, self.quorum)
+        for p in self.quorum:
+            self.post(p, MESSAGE_TYPE_PERMISSION_REQUEST, self.last_request_h)
+
+    def release(self):
+        # also withdraws a pending request: the arbiters drop it from their queue or unlock
+        self.requesting = False
+        self.in_cs = False
+        self.log.debug('resoure released')
+        for p in self.quorum:
+            self.post(p, MESSAGE_TYPE_RELEASE, self.last_request_h)
+
+    def on_message(self, sender: int, frame: Frame):
+        self.h = max(self.h, frame.clock)
+        if frame.type == MESSAGE_TYPE_PERMISSION_REQUEST:
+            self.arbiter_request(sender, frame.clock)
+        elif frame.type == MESSAGE_TYPE_RELEASE:
+            self.arbiter_release(sender, frame.clock)
+        elif frame.type == MESSAGE_TYPE_YIELD:
+            self.arbiter_yield(sender, frame.clock)
+        elif frame.type == MESSAGE_TYPE_PERMISSION_GRANTED:
+            self.on_locked(sender, frame.clock)
+        elif frame.type == MESSAGE_TYPE_FAILED:
+            self.on_failed(sender, frame.clock)
+        elif frame.type == MESSAGE_TYPE_INQUIRE:
+            self.on_inquire(sender, frame.clock)
+        else:
+            self.log.debug("[handler for %s] got unkown message type: %s", sender, frame.type)
+
+    # requester side
+
+    def current(self, h: int) -> bool:
+        return self.requesting and h == self.last_request_h
+
+    def on_locked(self, arbiter: int, h: int):
+        if not self.current(h):
+            self.log.debug("[handler for %s] ignoring LOCKED for old request h=%s", arbiter, h)
+            return
+        self.locks.add(arbiter)
+        self.failed.discard(arbiter)
+        self.yielded.discard(arbiter)
+        if len(self.locks) == len(self.quorum):
+            self.requesting = False
+            self.in_cs = True
+            self.inquiries.clear()
+            self.entered()
+
+    def on_failed(self, arbiter: int, h: int):
+        if not self.current(h):
+            return
+        self.failed.add(arbiter)
+        # we can't enter before an older request, give back the locks that are wanted elsewhere
+        for p in list(self.inquiries):
+            self.give_back(p)
+
+    def on_inquire(self, arbiter: int, h: int):
+        if not self.current(h) or arbiter not in self.locks:
+            return  # in the critical section or stale, the arbiter gets a RELEASE anyway
+        if self.failed or self.yielded:
+            self.give_back(arbiter)
+        else:
+            self.inquiries.add(arbiter)
+
+    def give_back(self, arbiter: int):
+        self.inquiries.discard(arbiter)
+        if arbiter in self.locks:
+            self.locks.discard(arbiter)
+            self.yielded.add(arbiter)
+            self.post(arbiter, MESSAGE_TYPE_YIELD, self.last_request_h)
+
+    # arbiter side
+
+    def lock_next(self):
+        self.inquired = False
+        if not self.queue:
+            self.locked_for = None
+            return
+        self.locked_for = heapq.heappop(self.queue)
+        h, node = self.locked_for
+        self.post(node, MESSAGE_TYPE_PERMISSION_GRANTED, h)
+
+    def arbiter_request(self, node: int, h: int):
+        request = (h, node)
+        if self.locked_for is None:
+            self.locked_for = request
+            self.post(node, MESSAGE_TYPE_PERMISSION_GRANTED, h)
+            return
+        previous_head = self.queue[0] if self.queue else None
+        heapq.heappush(self.queue, request)
+        if request > self.locked_for or (previous_head is not None and request > previous_head):
+            self.post(node, MESSAGE_TYPE_FAILED, h)
+            return
+        if previous_head is not None:
+            # it was next in line and is not anymore
+            self.post(previous_head[1], MESSAGE_TYPE_FAILED, previous_head[0])
+        if not self.inquired:
+            # older than the request we locked for, ask for the lock back
+            self.inquired = True
+            self.post(self.locked_for[1], MESSAGE_TYPE_INQUIRE, self.locked_for[0])
+
+    def arbiter_yield(self, node: int, h: int):
+        if self.locked_for != (h, node):
+            return
+        heapq.heappush(self.queue, self.locked_for)
+        self.lock_next()
+
+    def arbiter_release(self, node: int, h: int):
+        if self.locked_for == (h, node):
+            self.lock_next()
+        elif (h, node) in self.queue:
+            # a withdrawn request that was still queued
+            self.queue.remove((h, node))
+            heapq.heapify(self.queue)
+
+
+class SuzukiKasami(MutexAlgorithm):
+    """
+    token based: whoever holds the privilege token may enter, as often as it wants while nobody else asks.
+    a request is broadcast with a per-node sequence number (RN), the token carries the sequence number
+    of the last entry of every node (LN) and the queue of nodes it goes to next.
+    at most N messages per entry, none when the holder enters again.
+    a node has an outstanding request while RN is above LN, not only exactly one above: a request that timed
+    out is withdrawn locally and the next one raises RN again. a token that reaches a node whose request was
+    withdrawn is passed straight on.
+    the node with the lowest id holds the token at start, all nodes must know the same node ids.
+    an instance is never idle(): a new one would not know where the token is nor which requests are outstanding
+    """
+    name = 'suzuki_kasami'
+
+    LN_ENTRY = struct.Struct('<IQ')  # node, sequence number of its last entry
+    QUEUE_ENTRY = struct.Struct('<I')
+    COUNT = struct.Struct('<I')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.nodes = sorted(self.peers + [self.node_id])  # the order a release queues the waiting nodes in
+        self.rn: Dict[int, int] = {p: 0 for p in self.nodes}  # highest request number seen from every node
+        self.has_token = self.node_id == self.nodes[0]
+        self.ln: Dict[int, int] = {p: 0 for p in self.nodes}  # only meaningful while we hold the token
+        self.token_queue: Deque[int] = deque()
+        self.queued: Set[int] = set()  # the nodes in token_queue
+
+    def can_enter_without_messages(self) -> bool:
+        return self.has_token and not self.in_cs and not self.requesting
+
+    def queue_length(self) -> int:
+        if not self.has_token:
+            return 0
+        return sum(1 for p in self.peers if self.rn[p] > self.ln.get(p, 0))
+
+    def on_peer_down(self, node: int):
+        # the token must not go to a dead node, it gets queued again when it is back and still asking.
+        # if the dead node holds the token it is lost, requests wait until it comes back (or time out)
+        super().on_peer_down(node)
+        if node in self.queued:
+            self.token_queue.remove(node)
+            self.queued.discard(node)
+
+    def on_peer_up(self, node: int):
+        super().on_peer_up(node)
+        if self.has_token and not self.in_cs and node not in self.queued and self.rn.get(node, 0) > self.ln.get(node, 0):
+            self.enqueue(node)
+            self.pass_token()
+
+    def request(self, shared=False):
+        if self.has_token:
+            self.in_cs = True
+            self.entered()
+            return
+        self.requesting = True
+        self.rn[self.node_id] += 1
+        self.h = self.rn[self.node_id]
+        self.log.debug("will send MESSAGE(type=PERMISSION_REQUEST, port=%s, n=%s) to nodes %s", self.node_id, self.h, self.peers)
+        for p in self.peers:
+            self.send(p, self.frame(MESSAGE_TYPE_PERMISSION_REQUEST, self.h))
+
+    def release(self):
+        # also withdraws a request: the token will be passed on as soon as it arrives
+        self.requesting = False
+        if not self.in_cs:
+            return
+        self.in_cs = False
+        self.log.debug('resoure released')
+        self.ln[self.node_id] = self.rn[self.node_id]
+        for p in self.nodes:
+            if self.rn[p] > self.ln.get(p, 0) and p not in self.queued and p not in self.down:
+                self.enqueue(p)
+        self.pass_token()
+
+    def enqueue(self, node: int):
+        self.token_queue.append(node)
+        self.queued.add(node)
+
+    def pass_token(self):
+        while self.token_queue and self.token_queue[0] in self.down:
+            self.queued.discard(self.token_queue.popleft())  # queued by a holder that did not know it is down
+        if not self.token_queue:
+            return
+        node = self.token_queue.popleft()
+        self.queued.discard(node)
+        self.log.debug("will send MESSAGE(type=TOKEN, port=%s) to node %s", self.node_id, node)
+        self.has_token = False
+        self.send(node, self.frame(MESSAGE_TYPE_TOKEN, self.rn[node], payload=self.encode_token()))
+
+    def on_message(self, sender: int, frame: Frame):
+        if frame.type == MESSAGE_TYPE_PERMISSION_REQUEST:
+            if sender not in self.rn:
+                # the node ids are fixed at start, a stranger could never be handed the token
+                self.log.debug("ignoring MESSAGE(type=PERMISSION_REQUEST) from node %s, it is not a member", sender)
+                return
+            self.rn[sender] = max(self.rn[sender], frame.clock)
+            self.log.debug("[handler for %s] got MESSAGE(type=PERMISSION_REQUEST, port=%s, n=%s) from node %s", sender, sender, frame.clock, sender)
+            if self.has_token and not self.in_cs and self.rn[sender] > self.ln.get(sender, 0) and sender not in self.queued and sender not in self.down:
+                self.enqueue(sender)
+                self.pass_token()
+        elif frame.type == MESSAGE_TYPE_TOKEN:
+            self.log.debug("[handler for %s] got MESSAGE(type=TOKEN, port=%s) from node %s", sender, sender, sender)
+            self.decode_token(frame.payload)
+            self.has_token = True
+            if self.requesting:
+                self.requesting = False
+                self.in_cs = True
+                self.entered()
+            else:
+                # the request was withdrawn, hand the token over right away
+                self.in_cs = True
+                self.release()
+        else:
+            self.log.debug("[handler for %s] got unkown message type: %s", sender, frame.type)
+
+    def encode_token(self) -> bytes:
+        parts = [self.COUNT.pack(len(self.ln))]
+        parts.extend(self.LN_ENTRY.pack(p, n) for p, n in self.ln.items())
+        parts.append(self.COUNT.pack(len(self.token_queue)))
+        parts.extend(self.QUEUE_ENTRY.pack(p) for p in self.token_queue)
+        return b''.join(parts)
+
+    def decode_token(self, payload: bytes):
+        offset = 0
+        count, = self.COUNT.unpack_from(payload, offset)
+        offset += self.COUNT.size
+        self.ln = {}
+        for _ in range(count):
+            p, n = self.LN_ENTRY.unpack_from(payload, offset)
+            offset += self.LN_ENTRY.size
+            self.ln[p] = n
+        count, = self.COUNT.unpack_from(payload, offset)
+        offset += self.COUNT.size
+        self.token_queue = deque(self.QUEUE_ENTRY.unpack_from(payload, offset + i * self.QUEUE_ENTRY.size)[0] for i in range(count))
+        self.queued = set(self.token_queue)
+
+
+ALGORITHMS: Dict[str, Type[MutexAlgorithm]] = {a.name: a for a in (RicartAgrawala, RoucairolCarvalho, Maekawa, SuzukiKasami)}
+
+
+def get_algorithm(name: str) -> Type[MutexAlgorithm]:
+    try:
+        return ALGORITHMS[name]
+    except KeyError:
+        raise ValueError(f"unknown algorithm {name!r}, available: {', '.join(ALGORITHMS)}") from None
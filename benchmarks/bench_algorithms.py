@@ -0,0 +1,75 @@
+"""
+messages and acquire latency per critical-section entry for each algorithm, with N nodes running
+in this process on loopback (one event loop, real sockets). every node enters "entries" times,
+all nodes at once
+
+    python benchmarks/bench_algorithms.py [nodes=3,5,10,25,50,100] [entries=3] [algorithms=ricart_agrawala,maekawa]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from algorithms import ALGORITHMS  # noqa: E402
+from cli_io import SilentIO, get_arg  # noqa: E402
+from node import Node  # noqa: E402
+
+
+class CountingNode(Node):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent = 0
+
+    def send(self, port, frame):
+        self.sent += 1
+        super().send(port, frame)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(algorithm: str, n: int, entries: int, base_port: int):
+    ports = [base_port + i for i in range(n)]
+    nodes = [CountingNode(p, [q for q in ports if q != p], log=SilentIO(), request_timeout=60, algorithm=algorithm)
+             for p in ports]
+    for node in nodes:
+        await node.start()
+    latencies = []
+    inside = 0
+
+    async def work(node: Node):
+        nonlocal inside
+        for _ in range(entries):
+            start = time.perf_counter()
+            await node.acquire()
+            latencies.append(time.perf_counter() - start)
+            inside += 1
+            assert inside == 1, "two nodes in the critical section"
+            await asyncio.sleep(0)
+            inside -= 1
+            await node.release()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(work(node) for node in nodes))
+    elapsed = time.perf_counter() - start
+    for node in nodes:
+        node.stop()
+        await node.serve()
+    total = n * entries
+    print(f"{algorithm:<20} {n:>4} {total:>8} {sum(node.sent for node in nodes) / total:>10.1f} "
+          f"{sum(latencies) / total * 1000:>10.2f} {percentile(latencies, 0.99) * 1000:>10.2f} {total / elapsed:>10.1f}")
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in get_arg('nodes', cli_fallback=False, default='3,5,10,25,50,100').split(',')]
+    entries = int(get_arg('entries', cli_fallback=False, default=3))
+    algorithms = get_arg('algorithms', cli_fallback=False, default=','.join(ALGORITHMS)).split(',')
+    print(f"{'algorithm':<20} {'N':>4} {'entries':>8} {'msg/entry':>10} {'mean ms':>10} {'p99 ms':>10} {'entries/s':>10}")
+    base_port = 21000
+    for algorithm in algorithms:
+        for n in sizes:
+            asyncio.run(run(algorithm, n, entries, base_port))
+            base_port += n  # the previous ports may still be in TIME_WAIT
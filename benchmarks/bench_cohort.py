@@ -0,0 +1,74 @@
+"""
+local threads contending for the same lock on every node: without cohort hand over every entry is a
+message round, with it a release passes the critical section to the next local thread while the
+fairness budget allows. N nodes in this process, each with its own event loop thread
+
+    python benchmarks/bench_cohort.py [nodes=3] [threads=4] [entries=200] [budgets=0,4,16] [algorithm=ricart_agrawala]
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cli_io import get_arg  # noqa: E402
+from distributed_mutex import DistributedMutex  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(n: int, threads: int, entries: int, budget: int, algorithm: str, base_port: int):
+    ports = [base_port + i for i in range(n)]
+    mutexes = [DistributedMutex(p, [q for q in ports if q != p], request_timeout=60, algorithm=algorithm,
+                                metrics=True, cohort_budget=budget) for p in ports]
+    inside = 0
+    violations = 0
+    latencies = []
+    node_entries = {p: 0 for p in ports}
+    counter_lock = threading.Lock()
+
+    def work(mutex: DistributedMutex):
+        nonlocal inside, violations
+        for _ in range(entries):
+            start = time.perf_counter()
+            with mutex:
+                waited = time.perf_counter() - start
+                with counter_lock:
+                    inside += 1
+                    violations += inside != 1
+                time.sleep(0.0001)
+                with counter_lock:
+                    inside -= 1
+                    latencies.append(waited)
+                    node_entries[mutex.our_port] += 1
+
+    workers = [threading.Thread(target=work, args=(mutex,)) for mutex in mutexes for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    messages = sum(sum(mutex.node.metrics.messages_sent.values.values()) for mutex in mutexes)
+    handoffs = sum(sum(mutex.node.metrics.cohort_handoffs.values.values()) for mutex in mutexes)
+    for mutex in mutexes:
+        mutex.close()
+    total = len(latencies)
+    print(f"{budget:>6} {total:>8} {total / elapsed:>10.1f} {messages / total:>10.2f} {handoffs / total:>9.2f} "
+          f"{percentile(latencies, 0.5) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f} {violations:>10}")
+
+
+if __name__ == '__main__':
+    n = int(get_arg('nodes', cli_fallback=False, default=3))
+    threads = int(get_arg('threads', cli_fallback=False, default=4))
+    entries = int(get_arg('entries', cli_fallback=False, default=200))
+    algorithm = get_arg('algorithm', cli_fallback=False, default='ricart_agrawala')
+    budgets = [int(b) for b in get_arg('budgets', cli_fallback=False, default='0,4,16').split(',')]
+    base_port = int(get_arg('base_port', cli_fallback=False, default=26000))
+    print(f"{'budget':>6} {'entries':>8} {'entries/s':>10} {'msg/entry':>10} {'handoffs':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'violations':>10}")
+    for i, budget in enumerate(budgets):
+        run(n, threads, entries, budget, algorithm, base_port + i * n)
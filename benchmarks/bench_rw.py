@@ -0,0 +1,68 @@
+"""
+read-heavy throughput of ricart_agrawala with shared (read) requests against the same load where
+every entry is exclusive. N nodes run in this process on loopback, every node enters "entries" times,
+each entry is a read with probability "reads" and holds the lock for "hold" milliseconds
+
+    python benchmarks/bench_rw.py [nodes=5,10,25] [entries=20] [reads=0.9] [hold=2]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cli_io import SilentIO, get_arg  # noqa: E402
+from node import Node  # noqa: E402
+
+
+async def run(mode: str, n: int, entries: int, reads: float, hold: float, base_port: int):
+    ports = [base_port + i for i in range(n)]
+    nodes = [Node(p, [q for q in ports if q != p], log=SilentIO(), request_timeout=120) for p in ports]
+    for node in nodes:
+        await node.start()
+    rng = random.Random(42)
+    plan = [[rng.random() < reads for _ in range(entries)] for _ in nodes]
+    readers = 0
+    writers = 0
+    most_readers = 0
+
+    async def work(node: Node, entries_plan):
+        nonlocal readers, writers, most_readers
+        for read in entries_plan:
+            shared = read and mode == 'shared'
+            await node.acquire(shared=shared)
+            if shared:
+                readers += 1
+                most_readers = max(most_readers, readers)
+            else:
+                writers += 1
+            assert writers <= 1 and not (writers and readers), "a writer is in together with another holder"
+            await asyncio.sleep(hold)
+            if shared:
+                readers -= 1
+            else:
+                writers -= 1
+            await node.release()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(work(node, entries_plan) for node, entries_plan in zip(nodes, plan)))
+    elapsed = time.perf_counter() - start
+    for node in nodes:
+        node.stop()
+        await node.serve()
+    total = n * entries
+    print(f"{mode:<10} {n:>4} {total:>8} {elapsed:>10.2f} {total / elapsed:>10.1f} {most_readers:>12}")
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in get_arg('nodes', cli_fallback=False, default='5,10,25').split(',')]
+    entries = int(get_arg('entries', cli_fallback=False, default=20))
+    reads = float(get_arg('reads', cli_fallback=False, default=0.9))
+    hold = float(get_arg('hold', cli_fallback=False, default=2)) / 1000
+    print(f"{'mode':<10} {'N':>4} {'entries':>8} {'seconds':>10} {'entries/s':>10} {'max readers':>12}")
+    base_port = 22000
+    for n in sizes:
+        for mode in ('exclusive', 'shared'):
+            asyncio.run(run(mode, n, entries, reads, hold, base_port))
+            base_port += n  # the previous ports may still be in TIME_WAIT
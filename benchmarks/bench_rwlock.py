@@ -0,0 +1,161 @@
+"""
+contention benchmark of cli_io.RWLock against the ReentrantRWLock it replaced (copied below),
+1 to 64 threads each taking the lock "ops" times, "writes" of the time for writing.
+"violations" counts the times a reader saw a writer inside, which the old lock allowed.
+the old lock shares one stack of 'with' modes between all threads, so a thread may release
+the other mode than it took: a run that does not finish within "limit" seconds is reported as stuck
+
+    python benchmarks/bench_rwlock.py [threads=1,2,4,8,16,32,64] [ops=20000] [writes=0.1] [limit=10]
+"""
+import os
+import random
+import sys
+import threading
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cli_io import RWLock, get_arg  # noqa: E402
+
+
+class ReentrantRWLock:
+    """
+    A lock object that allows many simultaneous "read locks", but only one "write lock."
+    it also ignores multiple write locks from the same thread
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._writer = None  # current writer
+        self._readers: List[int] = []  # list of unique readers
+        self._read_ready = threading.Condition(threading.Lock())
+        self._with_ops_write = []  # stack for 'with' keyword for write or read operations, 0 for read 1 for write
+        self._ops_arr_lock = threading.Lock()  # lock for previous list
+
+    def acquire_read(self):
+        """
+        Acquire a read lock. Blocks only if a another thread has acquired the write lock.
+        """
+        ident = threading.current_thread().ident
+        if self._writer == ident or ident in self._readers:
+            return
+        with self._read_ready:
+            self._readers.append(ident)
+
+    def release_read(self):
+        """
+        Release a read lock if exists from this thread
+        """
+        ident = threading.current_thread().ident
+        if self._writer == ident or ident not in self._readers:
+            return
+        with self._read_ready:
+            self._readers.remove(ident)
+            if len(self._readers) == 0:
+                self._read_ready.notify_all()
+
+    def acquire_write(self):
+        """
+        Acquire a write lock. Blocks until there are no acquired read or write locks from another thread.
+        """
+        ident = threading.current_thread().ident
+        if self._writer == ident:
+            return
+        self._read_ready.acquire()
+        me_included = 1 if ident in self._readers else 0
+        while len(self._readers) - me_included > 0:
+            self._read_ready.wait()
+        self._writer = ident
+
+    def release_write(self):
+        """
+        Release a write lock if exists from this thread.
+        """
+        if not self._writer or not self._writer == threading.current_thread().ident:
+            return
+        self._writer = None
+        self._read_ready.release()
+
+    def __enter__(self):
+        with self._ops_arr_lock:
+            if len(self._with_ops_write) == 0:
+                raise RuntimeError("ReentrantRWLock: used 'with' block without call to for_read or for_write")
+            write = self._with_ops_write[-1]
+        if write:
+            self.acquire_write()
+        else:
+            self.acquire_read()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        with self._ops_arr_lock:
+            write = self._with_ops_write.pop()
+        if write:
+            self.release_write()
+        else:
+            self.release_read()
+        if exc_type is not None:
+            return False  # exception happened
+        return True
+
+    def for_read(self):
+        """
+        used for 'with' block
+        """
+        with self._ops_arr_lock:
+            self._with_ops_write.append(0)
+        return self
+
+    def for_write(self):
+        """
+        used for 'with' block
+        """
+        with self._ops_arr_lock:
+            self._with_ops_write.append(1)
+        return self
+
+
+def run(lock, threads: int, ops: int, writes: float, limit: float):
+    writers_inside = 0
+    violations = 0
+    start_barrier = threading.Barrier(threads + 1)
+
+    def work(seed: int):
+        nonlocal writers_inside, violations
+        rng = random.Random(seed)
+        plan = [rng.random() < writes for _ in range(ops)]
+        start_barrier.wait()
+        for write in plan:
+            if write:
+                with lock.for_write():
+                    writers_inside += 1
+                    writers_inside -= 1
+            else:
+                with lock.for_read():
+                    if writers_inside:
+                        violations += 1
+
+    workers = [threading.Thread(target=work, args=(i,), daemon=True) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join(max(start + limit - time.perf_counter(), 0))
+        if worker.is_alive():
+            return None, violations  # deadlocked, the daemon threads are left behind
+    elapsed = time.perf_counter() - start
+    return threads * ops / elapsed, violations
+
+
+if __name__ == '__main__':
+    thread_counts = [int(n) for n in get_arg('threads', cli_fallback=False, default='1,2,4,8,16,32,64').split(',')]
+    ops = int(get_arg('ops', cli_fallback=False, default=20000))
+    writes = float(get_arg('writes', cli_fallback=False, default=0.1))
+    limit = float(get_arg('limit', cli_fallback=False, default=10))
+    print(f"{'lock':<24} {'threads':>8} {'ops/s':>12} {'violations':>11}")
+    for threads in thread_counts:
+        for name, factory in (('ReentrantRWLock (old)', ReentrantRWLock), ('RWLock writers', RWLock),
+                              ('RWLock fair', lambda: RWLock('fair'))):
+            per_second, violations = run(factory(), threads, ops, writes, limit)
+            result = 'stuck' if per_second is None else f'{per_second:.0f}'
+            print(f"{name:<24} {threads:>8} {result:>12} {violations:>11}")
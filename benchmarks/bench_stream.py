@@ -0,0 +1,106 @@
+"""
+compares the receive path of BufferedSocketStream with the copying buffer it replaced,
+on a stream of many small messages (8-byte values, like the protocol sends)
+
+    python benchmarks/bench_stream.py [messages=200000]
+"""
+import asyncio
+import os
+import socket as sockets
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from BufferedSocketStream import AsyncBufferedSocketStream, BufferedSocketStream  # noqa: E402
+
+
+class CopyingSocketStream(BufferedSocketStream):
+    """
+    the previous read(): slices the front of a bytearray and reallocates the rest on every call
+    """
+
+    def __init__(self, socket):
+        super().__init__(socket)
+        self.copy_buffer = bytearray()
+        self.size = 0
+
+    def read(self, count) -> bytes:
+        while True:
+            if count <= self.size:
+                part = self.copy_buffer[:count]
+                self.copy_buffer = self.copy_buffer[count:]
+                self.size -= count
+                return part
+            received = self.socket.recv(64 * 1024)
+            if received == b'':
+                raise ConnectionError("received 0 bytes possibly socket disconnected")
+            self.copy_buffer.extend(received)
+            self.size += len(received)
+
+
+def payload(messages: int) -> bytes:
+    return b''.join(i.to_bytes(length=8, byteorder='little') for i in range(messages))
+
+
+def send_in_background(sock: sockets.socket, data: bytes):
+    def send():
+        sock.sendall(data)
+        sock.shutdown(sockets.SHUT_WR)
+    t = threading.Thread(target=send, daemon=True)
+    t.start()
+    return t
+
+
+def bench_sync(stream_class, messages: int) -> float:
+    a, b = sockets.socketpair()
+    sender = send_in_background(a, payload(messages))
+    stream = stream_class(b)
+    start = time.perf_counter()
+    for i in range(messages):
+        assert stream.read_int32() == i
+    elapsed = time.perf_counter() - start
+    sender.join()
+    a.close()
+    b.close()
+    return elapsed
+
+
+async def bench_async_streamreader(messages: int) -> float:
+    a, b = sockets.socketpair()
+    sender = send_in_background(a, payload(messages))
+    reader, writer = await asyncio.open_connection(sock=b)
+    start = time.perf_counter()
+    for i in range(messages):
+        assert int.from_bytes(await reader.readexactly(8), byteorder='little') == i
+    elapsed = time.perf_counter() - start
+    writer.close()
+    sender.join()
+    a.close()
+    return elapsed
+
+
+async def bench_async_stream(messages: int) -> float:
+    a, b = sockets.socketpair()
+    sender = send_in_background(a, payload(messages))
+    _, stream = await asyncio.get_running_loop().connect_accepted_socket(AsyncBufferedSocketStream, sock=b)
+    start = time.perf_counter()
+    for i in range(messages):
+        assert await stream.read_int32() == i
+    elapsed = time.perf_counter() - start
+    stream.close()
+    sender.join()
+    a.close()
+    return elapsed
+
+
+def report(name: str, messages: int, elapsed: float):
+    print(f"{name:<36} {elapsed * 1000:9.1f} ms  {messages / elapsed:12,.0f} msg/s")
+
+
+if __name__ == '__main__':
+    messages = int(sys.argv[1].split('=')[-1]) if len(sys.argv) > 1 else 200000
+    report('BufferedSocketStream (copying)', messages, bench_sync(CopyingSocketStream, messages))
+    report('BufferedSocketStream (recv_into)', messages, bench_sync(BufferedSocketStream, messages))
+    report('asyncio.StreamReader.readexactly', messages, asyncio.run(bench_async_streamreader(messages)))
+    report('AsyncBufferedSocketStream', messages, asyncio.run(bench_async_stream(messages)))
@@ -0,0 +1,79 @@
+"""
+permission round-trip latency on each transport: this process acquires and releases "entries" times
+against a peer node in another process, with ricart_agrawala an uncontended acquire is one request
+and one permission, so its latency is the round trip plus the work of both nodes
+
+    python benchmarks/bench_transport.py [transports=tcp,unix,shm] [entries=5000] [base_port=25000]
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cli_io import SilentIO, get_arg, get_argflag  # noqa: E402
+from node import TRANSPORTS, Node  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def peer():
+    """
+    the other node: answer until stdin closes
+    """
+    node = Node(int(get_arg('port')), [int(get_arg('other'))], log=SilentIO(), transport=get_arg('transport'))
+    await node.start()
+    print('ready', flush=True)
+    await asyncio.get_running_loop().run_in_executor(None, sys.stdin.read)
+    node.stop()
+    await node.serve()
+
+
+async def measure(transport: str, port: int, other: int, entries: int):
+    node = Node(port, [other], log=SilentIO(), request_timeout=10, transport=transport)
+    await node.start()
+    for _ in range(100):  # connect and warm up
+        await node.acquire()
+        await node.release()
+    latencies = []
+    cpu_start = time.process_time()
+    for _ in range(entries):
+        start = time.perf_counter()
+        await node.acquire()
+        latencies.append(time.perf_counter() - start)
+        await node.release()
+    cpu = time.process_time() - cpu_start
+    node.stop()
+    await node.serve()
+    return latencies, cpu
+
+
+def run(transport: str, base_port: int, entries: int):
+    port, other = base_port, base_port + 1
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'peer', f'port={other}', f'other={port}',
+                                f'transport={transport}'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        if process.stdout.readline().strip() != 'ready':
+            raise RuntimeError(f"peer process exited with {process.wait()}")
+        latencies, cpu = asyncio.run(measure(transport, port, other, entries))
+    finally:
+        process.stdin.close()
+        process.wait()
+    print(f"{transport:<6} {entries:>8} {percentile(latencies, 0.5) * 1e6:>8.1f} {percentile(latencies, 0.99) * 1e6:>8.1f} "
+          f"{sum(latencies) / len(latencies) * 1e6:>9.1f} {cpu / entries * 1e6:>13.1f}")
+
+
+if __name__ == '__main__':
+    if get_argflag('peer'):
+        asyncio.run(peer())
+        sys.exit(0)
+    transports = get_arg('transports', cli_fallback=False, default=','.join(TRANSPORTS)).split(',')
+    entries = int(get_arg('entries', cli_fallback=False, default=5000))
+    base_port = int(get_arg('base_port', cli_fallback=False, default=25000))
+    print(f"{'transport':<6} {'entries':>8} {'p50 us':>8} {'p99 us':>8} {'mean us':>9} {'cpu us/entry':>13}")
+    for i, transport in enumerate(transports):
+        run(transport, base_port + 2 * i, entries)
@@ -0,0 +1,182 @@
+"""
+launches N nodes on localhost, each in its own process, drives a synthetic workload through them
+and writes the results as JSON:
+
+    python benchmarks/harness.py [nodes=5] [algorithm=ricart_agrawala] [duration=5] [rate=20] [mix=1]
+                                 [hold=1] [base_port=24000] [out=results.json]
+
+- rate: entries per second asked by an average node, the arrivals are poisson and do not wait for the
+  previous entry (latency includes the time queued behind it). rate=0 enters back to back for "duration"
+- mix: comma separated weights of the nodes' rates (repeated over the nodes), "4,1" makes every
+  other node 4 times busier, a weight of 0 only answers the others
+- hold: milliseconds spent inside the critical section
+
+reported per node and for the cluster: p50/p99/p99.9 acquire latency, entries/s, messages per entry
+and cpu seconds of the node process
+"""
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cli_io import SilentIO, get_arg, get_argflag  # noqa: E402
+from node import Node  # noqa: E402
+
+
+class CountingNode(Node):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent = 0
+
+    def send(self, port, frame):
+        self.sent += 1
+        super().send(port, frame)
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def latency_summary(latencies: List[float]) -> dict:
+    return {
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'p999_ms': percentile(latencies, 0.999) * 1000,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+async def work(node: CountingNode, rate: float, duration: float, hold: float, start_at: float, seed: int) -> dict:
+    rng = random.Random(seed)
+    await asyncio.sleep(max(start_at - time.time(), 0))
+    cpu_start = time.process_time()
+    start = time.monotonic()
+    end = start + duration
+    latencies = []
+    arrival = start
+    while rate != 0:
+        if rate > 0:
+            arrival = arrival + rng.expovariate(rate)
+        else:
+            arrival = time.monotonic()  # back to back
+        if arrival >= end:
+            break
+        await asyncio.sleep(max(arrival - time.monotonic(), 0))
+        await node.acquire()
+        latencies.append(time.monotonic() - arrival)
+        await asyncio.sleep(hold)
+        await node.release()
+    elapsed = time.monotonic() - start
+    return {
+        'port': node.our_port,
+        'entries': len(latencies),
+        'messages': node.sent,
+        'elapsed_s': elapsed,
+        'cpu_s': time.process_time() - cpu_start,
+        'latencies': latencies,
+    }
+
+
+async def worker():
+    """
+    one node: serve, run the workload, print the result line, keep answering the others until stdin closes
+    """
+    port = int(get_arg('port'))
+    ports = [int(p) for p in get_arg('ports').split(',')]
+    node = CountingNode(port, [p for p in ports if p != port], log=SilentIO(),
+                        algorithm=get_arg('algorithm', cli_fallback=False, default='ricart_agrawala'))
+    await node.start()
+    result = await work(node, rate=float(get_arg('rate')), duration=float(get_arg('duration')),
+                        hold=float(get_arg('hold')) / 1000, start_at=float(get_arg('start_at')), seed=port)
+    print(json.dumps(result), flush=True)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, sys.stdin.read)  # the coordinator closes stdin once every node is done
+    node.stop()
+    await node.serve()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def run(n: int, algorithm: str, duration: float, rate: float, mix: List[float], hold: float, base_port: int) -> dict:
+    ports = [base_port + i for i in range(n)]
+    weights = [mix[i % len(mix)] for i in range(n)]
+    mean_weight = sum(weights) / n
+    start_at = time.time() + 1 + n * 0.02  # every node listens before anyone asks
+    processes = []
+    for port, weight in zip(ports, weights):
+        node_rate = rate * weight / mean_weight if rate > 0 else (-1 if weight > 0 else 0)
+        processes.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), 'worker', f'port={port}', f'ports={",".join(map(str, ports))}',
+             f'algorithm={algorithm}', f'rate={node_rate}', f'duration={duration}', f'hold={hold}', f'start_at={start_at}'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True))
+    try:
+        results = []
+        for process in processes:
+            line = process.stdout.readline()
+            if not line:
+                raise RuntimeError(f"node process {process.args[3]} exited with {process.wait()}")
+            results.append(json.loads(line))
+    finally:
+        for process in processes:
+            process.stdin.close()
+        for process in processes:
+            process.wait()
+
+    latencies = [latency for result in results for latency in result['latencies']]
+    entries = len(latencies)
+    elapsed = max(result['elapsed_s'] for result in results)
+    for result, weight in zip(results, weights):
+        result['weight'] = weight
+        result.update(latency_summary(result.pop('latencies')))
+    summary = {
+        'entries': entries,
+        'entries_per_s': entries / elapsed if elapsed else 0.0,
+        'messages_per_entry': sum(result['messages'] for result in results) / entries if entries else 0.0,
+        'cpu_s_per_node': sum(result['cpu_s'] for result in results) / n,
+    }
+    summary.update(latency_summary(latencies))
+    return {
+        'commit': git_commit(),
+        'config': {'nodes': n, 'algorithm': algorithm, 'duration_s': duration, 'rate': rate, 'mix': mix,
+                   'hold_ms': hold},
+        'summary': summary,
+        'nodes': results,
+    }
+
+
+if __name__ == '__main__':
+    if get_argflag('worker'):
+        asyncio.run(worker())
+        sys.exit(0)
+    report = run(n=int(get_arg('nodes', cli_fallback=False, default=5)),
+                 algorithm=get_arg('algorithm', cli_fallback=False, default='ricart_agrawala'),
+                 duration=float(get_arg('duration', cli_fallback=False, default=5)),
+                 rate=float(get_arg('rate', cli_fallback=False, default=20)),
+                 mix=[float(w) for w in get_arg('mix', cli_fallback=False, default='1').split(',')],
+                 hold=float(get_arg('hold', cli_fallback=False, default=1)),
+                 base_port=int(get_arg('base_port', cli_fallback=False, default=24000)))
+    summary = report['summary']
+    print(f"{report['config']['algorithm']} N={report['config']['nodes']}: {summary['entries']} entries, "
+          f"{summary['entries_per_s']:.1f} entries/s, {summary['messages_per_entry']:.1f} msg/entry, "
+          f"p50 {summary['p50_ms']:.2f} ms, p99 {summary['p99_ms']:.2f} ms, p99.9 {summary['p999_ms']:.2f} ms, "
+          f"cpu {summary['cpu_s_per_node']:.2f} s/node", file=sys.stderr)
+    out = get_arg('out', cli_fallback=False)
+    if out:
+        with open(out, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
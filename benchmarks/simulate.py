@@ -0,0 +1,56 @@
+"""
+runs the algorithms on the deterministic simulated network (simulator.py) instead of sockets: virtual time,
+seeded delays, optional drops, reordering and a partition. checks safety on every entry and exits with 1
+if two writers (or a writer and a reader) were ever inside together
+
+    python benchmarks/simulate.py [algorithms=ricart_agrawala,maekawa] [nodes=10,100,1000] [entries=10] [seeds=1]
+                                  [think=10] [hold=1] [min_delay=0.5] [max_delay=2] [drop=0] [reorder]
+                                  [partition=100:300] [read_ratio=0] [out=results.json]
+
+times are in milliseconds. entries is per node. partition=start:end cuts the nodes in two halves between
+those virtual times, the messages between the halves arrive when it heals
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from algorithms import ALGORITHMS  # noqa: E402
+from cli_io import get_arg, get_argflag  # noqa: E402
+from simulator import Simulation  # noqa: E402
+
+if __name__ == '__main__':
+    algorithms = get_arg('algorithms', cli_fallback=False, default=','.join(ALGORITHMS)).split(',')
+    sizes = [int(n) for n in get_arg('nodes', cli_fallback=False, default='10,100').split(',')]
+    entries = int(get_arg('entries', cli_fallback=False, default=10))
+    seeds = int(get_arg('seeds', cli_fallback=False, default=1))
+    partition = get_arg('partition', cli_fallback=False)
+    options = dict(think=float(get_arg('think', cli_fallback=False, default=10)) / 1000,
+                   hold=float(get_arg('hold', cli_fallback=False, default=1)) / 1000,
+                   min_delay=float(get_arg('min_delay', cli_fallback=False, default=0.5)) / 1000,
+                   max_delay=float(get_arg('max_delay', cli_fallback=False, default=2)) / 1000,
+                   drop_rate=float(get_arg('drop', cli_fallback=False, default=0)),
+                   read_ratio=float(get_arg('read_ratio', cli_fallback=False, default=0)),
+                   reorder=get_argflag('reorder'))
+    print(f"{'algorithm':<20} {'N':>5} {'seed':>4} {'entries':>9} {'stuck':>6} {'msg/entry':>10} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'max bypass':>10} {'violations':>10} {'wall s':>7}")
+    results = []
+    for algorithm in algorithms:
+        for n in sizes:
+            for seed in range(seeds):
+                simulation = Simulation(algorithm, nodes=n, entries=entries, seed=seed, **options)
+                if partition:
+                    start, end = (float(t) / 1000 for t in partition.split(':'))
+                    ids = [node.node_id for node in simulation.nodes]
+                    simulation.network.partition([set(ids[:n // 2]), set(ids[n // 2:])], start, end)
+                result = simulation.run()
+                result['seed'] = seed
+                results.append(result)
+                print(f"{algorithm:<20} {n:>5} {seed:>4} {result['entries']:>9} {result['stuck_requests']:>6} "
+                      f"{result['messages_per_entry']:>10.1f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                      f"{result['max_bypass']:>10} {result['violations']:>10} {result['wall_seconds']:>7.2f}")
+    out = get_arg('out', cli_fallback=False)
+    if out:
+        with open(out, 'w') as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if any(result['violations'] for result in results) else 0)
@@ -1,121 +1,190 @@
+import atexit
+import json
+import queue
 import sys
 import threading
+import time
 import traceback
-from typing import List, Optional
+from typing import List, NamedTuple, Optional, TextIO
 
 from readchar import readkey, key
 from termcolor import colored
 
 
-class ReentrantRWLock:
+class RWLock:
     """
-    A lock object that allows many simultaneous "read locks", but only one "write lock."
-    it also ignores multiple write locks from the same thread
+    many readers or one writer, every thread keeps its own reentrancy count:
+    a reader may read again, the writer may write or read again. a reader can't upgrade to a writer
+    (two upgrading readers would wait on each other forever), acquire_write raises RuntimeError then.
+    "preference" decides who goes first when both readers and writers wait:
+        'writers' (default): new readers wait behind waiting writers, writers never starve
+        'readers': readers enter whenever no writer holds the lock, writers may starve
+        'fair': readers that were already waiting when a writer releases go before the next writer,
+                readers that come later wait behind it
     """
 
-    def __init__(self):
-        super().__init__()
-        self._writer = None  # current writer
-        self._readers: List[int] = []  # list of unique readers
-        self._read_ready = threading.Condition(threading.Lock())
-        self._with_ops_write = []  # stack for 'with' keyword for write or read operations, 0 for read 1 for write
-        self._ops_arr_lock = threading.Lock()  # lock for previous list
+    PREFERENCES = ('writers', 'readers', 'fair')
+
+    def __init__(self, preference='writers'):
+        if preference not in self.PREFERENCES:
+            raise ValueError(f"unknown preference {preference!r}, available: {', '.join(self.PREFERENCES)}")
+        self.preference = preference
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0  # threads holding a read lock
+        self._writer: Optional[int] = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+        self._phase = 0  # incremented by every write release, see 'fair'
+        self._local = threading.local()  # reads: read depth of the current thread
+        self._read_mode = _RWLockMode(self.acquire_read, self.release_read)
+        self._write_mode = _RWLockMode(self.acquire_write, self.release_write)
+
+    def _reads(self) -> int:
+        return getattr(self._local, 'reads', 0)
 
     def acquire_read(self):
         """
-        Acquire a read lock. Blocks only if a another thread has acquired the write lock.
+        blocks while another thread holds the write lock (or, depending on "preference", waits for it)
         """
-        ident = threading.current_thread().ident
-        if self._writer == ident or ident in self._readers:
+        reads = self._reads()
+        if reads:
+            self._local.reads = reads + 1
             return
-        with self._read_ready:
-            self._readers.append(ident)
+        ident = threading.get_ident()
+        with self._cond:
+            if self._writer == ident:
+                self._writer_depth += 1  # a read inside our own write
+                return
+            phase = self._phase
+            while self._writer is not None or (self._waiting_writers and (
+                    self.preference == 'writers' or (self.preference == 'fair' and phase == self._phase))):
+                self._cond.wait()
+            self._readers += 1
+        self._local.reads = 1
 
     def release_read(self):
-        """
-        Release a read lock if exists from this thread
-        """
-        ident = threading.current_thread().ident
-        if self._writer == ident or ident not in self._readers:
+        reads = self._reads()
+        if not reads:
+            if self._writer == threading.get_ident():
+                self.release_write()
+                return
+            raise RuntimeError("release_read without a read lock")
+        self._local.reads = reads - 1
+        if reads > 1:
             return
-        with self._read_ready:
-            self._readers.remove(ident)
-            if len(self._readers) == 0:
-                self._read_ready.notifyAll()
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
 
     def acquire_write(self):
         """
-        Acquire a write lock. Blocks until there are no acquired read or write locks from another thread.
+        blocks until no other thread holds the lock
         """
-        ident = threading.current_thread().ident
-        if self._writer == ident:
-            return
-        self._read_ready.acquire()
-        me_included = 1 if ident in self._readers else 0
-        while len(self._readers) - me_included > 0:
-            self._read_ready.wait()
-        self._writer = ident
+        ident = threading.get_ident()
+        with self._cond:
+            if self._writer == ident:
+                self._writer_depth += 1
+                return
+            if self._reads():
+                raise RuntimeError("can't upgrade a read lock to a write lock")
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = ident
+            self._writer_depth = 1
 
     def release_write(self):
+        with self._cond:
+            if self._writer != threading.get_ident():
+                raise RuntimeError("release_write without the write lock")
+            self._writer_depth -= 1
+            if self._writer_depth:
+                return
+            self._writer = None
+            self._phase += 1
+            self._cond.notify_all()
+
+    def for_read(self) -> '_RWLockMode':
         """
-        Release a write lock if exists from this thread.
+        used for 'with' block
         """
-        if not self._writer or not self._writer == threading.current_thread().ident:
-            return
-        self._writer = None
-        self._read_ready.release()
+        return self._read_mode
+
+    def for_write(self) -> '_RWLockMode':
+        """
+        used for 'with' block
+        """
+        return self._write_mode
+
+
+class _RWLockMode:
+    def __init__(self, acquire, release):
+        self.acquire = acquire
+        self.release = release
 
     def __enter__(self):
-        with self._ops_arr_lock:
-            if len(self._with_ops_write) == 0:
-                raise RuntimeError("ReentrantRWLock: used 'with' block without call to for_read or for_write")
-            write = self._with_ops_write[-1]
-        if write:
-            self.acquire_write()
-        else:
-            self.acquire_read()
+        self.acquire()
 
     def __exit__(self, exc_type, exc_value, tb):
-        with self._ops_arr_lock:
-            write = self._with_ops_write.pop()
-        if write:
-            self.release_write()
-        else:
-            self.release_read()
+        self.release()
         if exc_type is not None:
             return False  # exception happened
         return True
 
-    def for_read(self):
-        """
-        used for 'with' block
-        """
-        with self._ops_arr_lock:
-            self._with_ops_write.append(0)
-        return self
-
-    def for_write(self):
-        """
-        used for 'with' block
-        """
-        with self._ops_arr_lock:
-            self._with_ops_write.append(1)
-        return self
 
 class ReadError(IOError):
     pass
 
 
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+SILENT = 100
+LEVEL_NAMES = {DEBUG: 'debug', INFO: 'info', WARNING: 'warning', ERROR: 'error'}
+
+
+class LogRecord(NamedTuple):
+    time: float
+    level: int
+    txt: object
+    args: tuple
+    new_line: bool
+    color: Optional[str]
+    thread: str
+
+    def message(self) -> str:
+        txt = str(self.txt)
+        if not self.args:
+            return txt
+        try:
+            return txt % self.args
+        except (TypeError, ValueError):
+            return f"{txt} {self.args!r}"
 
 
 class IO:
+    """
+    terminal prompt plus leveled logging. debug()/write()/warning()/error() only put a record on a queue,
+    the message is formatted ("txt % args") and printed by a background writer thread that handles
+    whatever is queued at once: the input line is cleared and redrawn once per batch, not once per line.
+    records below "level" are dropped before anything is formatted, so
+
+        log.debug("got %s from %s", frame.type, port)
+
+    costs one comparison when debug is off. flush() waits until everything queued is written
+    """
     def __init__(self):
         self.read_buffer = ''
         self.label = ''
         self.label_colored = ''
         self.read_lock = threading.Lock()
         self.write_lock = threading.RLock()
-        self.buffer_lock = ReentrantRWLock()
+        self.buffer_lock = RWLock()
         self.last_line = ''
         self.last_writer_was_reader = False
         self.read_interrupted_buffer = ''
@@ -125,7 +194,13 @@ class IO:
         self.read_error: Optional[ReadError] = None
         self.read_interrupted = False
         self.cursor_at = 0
-        self.debug_ignored = False
+        self.level = DEBUG  # terminal
+        self.file_level = SILENT  # structured file sink, see log_to_file()
+        self.min_level = DEBUG  # lowest level anything is written at
+        self.log_file: Optional[TextIO] = None
+        self.records: 'queue.SimpleQueue[object]' = queue.SimpleQueue()  # LogRecord, or an Event to set by flush()
+        self.writer: Optional[threading.Thread] = None
+        self.writer_lock = threading.Lock()
 
     def update_input_label(self, label):
         self.label = label
@@ -194,24 +269,24 @@ class IO:
         with self.write_lock:
             if self.cursor_at < len(self.read_buffer):
                 # delete char after cursor
-                self.read_buffer = self.read_buffer[:self.cursor_at] + self.read_buffer[self.cursor_at + 1:]
+                with self.buffer_lock.for_write():
+                    self.read_buffer = self.read_buffer[:self.cursor_at] + self.read_buffer[self.cursor_at + 1:]
                 self.__write_input()
 
     def handle_stroke(self, char):
-        with self.buffer_lock.for_read():
-            if char == key.UP:  # up
-                self.__command_up_key()
-            elif char == key.DOWN:  # bottom
-                self.__command_down_key()
-            elif char == key.LEFT:  # left
-                self.__command_left_key()
-            elif char == key.RIGHT:  # right
-                self.__command_right_key()
-            elif char == key.DELETE:  # delete
-                self.__command_delete_key()
-            else:
-                # modify the code and add another elif and handle it by yourself...
-                self.write(f"unhandled control: {char.encode('utf-8')}")
+        if char == key.UP:  # up
+            self.__command_up_key()
+        elif char == key.DOWN:  # bottom
+            self.__command_down_key()
+        elif char == key.LEFT:  # left
+            self.__command_left_key()
+        elif char == key.RIGHT:  # right
+            self.__command_right_key()
+        elif char == key.DELETE:  # delete
+            self.__command_delete_key()
+        else:
+            # modify the code and add another elif and handle it by yourself...
+            self.write(f"unhandled control: {char.encode('utf-8')}")
 
     def thread_read(self):
         self.__write_input()
@@ -231,12 +306,13 @@ class IO:
                     continue
                 delchr = ord(char) == 8 or ord(char) == 127
                 if delchr:
-                    with self.buffer_lock.for_write():
-                        if len(self.read_buffer) != 0 and self.cursor_at > 0:
-                            # delete char before cursor
-                            self.read_buffer = self.read_buffer[:self.cursor_at - 1] + self.read_buffer[self.cursor_at:]
-                            self.cursor_at -= 1
-                            self.__write_input()
+                    with self.write_lock:  # always before buffer_lock
+                        with self.buffer_lock.for_write():
+                            if len(self.read_buffer) != 0 and self.cursor_at > 0:
+                                # delete char before cursor
+                                self.read_buffer = self.read_buffer[:self.cursor_at - 1] + self.read_buffer[self.cursor_at:]
+                                self.cursor_at -= 1
+                                self.__write_input()
                     continue
                 line_feed = char == '\n' or char == '\r'
                 read_interrupted = ord(char) == 3
@@ -259,38 +335,119 @@ class IO:
             self.read_error = traceback.format_exc()
             return
         
+    def set_level(self, level: int):
+        self.level = level
+        self.min_level = min(self.level, self.file_level)
+
     def ignore_debug(self, ignore):
-        self.debug_ignored = ignore
+        self.set_level(INFO if ignore else DEBUG)
 
-    def debug(self, txt: object, new_line=True, color=None):
-        if self.debug_ignored:
+    def log_to_file(self, path: str, level=DEBUG):
+        """
+        also append every record at "level" or above to "path", one JSON object per line
+        """
+        self.log_file = open(path, 'a', encoding='utf-8')
+        self.file_level = level
+        self.min_level = min(self.level, self.file_level)
+
+    def debug(self, txt: object, *args, new_line=True, color=None):
+        if DEBUG < self.min_level:
+            return
+        self.log(DEBUG, txt, args, new_line, color)
+
+    def write(self, txt: object, *args, new_line=True, color=None):
+        if INFO < self.min_level:
+            return
+        self.log(INFO, txt, args, new_line, color)
+
+    def warning(self, txt: object, *args, new_line=True, color='yellow'):
+        if WARNING < self.min_level:
+            return
+        self.log(WARNING, txt, args, new_line, color)
+
+    def error(self, txt: object, *args, new_line=True, color='red'):
+        if ERROR < self.min_level:
+            return
+        self.log(ERROR, txt, args, new_line, color)
+
+    def log(self, level: int, txt: object, args: tuple, new_line=True, color=None):
+        if self.writer is None:
+            self.__start_writer()
+        self.records.put(LogRecord(time.time(), level, txt, args, new_line, color, threading.current_thread().name))
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        wait until the records queued so far are written
+        """
+        if self.writer is None or not self.writer.is_alive():
+            return
+        done = threading.Event()
+        self.records.put(done)
+        done.wait(timeout)
+
+    def __start_writer(self):
+        with self.writer_lock:
+            if self.writer is not None:
+                return
+            self.writer = threading.Thread(target=self.__write_records, name='IO-writer', daemon=True)
+            self.writer.start()
+            atexit.register(self.flush, 1)
+
+    def __write_records(self):
+        while True:
+            batch = [self.records.get()]
+            try:
+                while True:
+                    batch.append(self.records.get_nowait())
+            except queue.Empty:
+                pass
+            records = [record for record in batch if isinstance(record, LogRecord)]
+            try:
+                self.__write_terminal([record for record in records if record.level >= self.level])
+                if self.log_file is not None:
+                    self.__write_file([record for record in records if record.level >= self.file_level])
+            except Exception:
+                pass  # nowhere left to report it
+            for record in batch:
+                if isinstance(record, threading.Event):
+                    record.set()
+
+    def __write_terminal(self, records: List[LogRecord]):
+        if not records:
             return
-        self.write(txt, new_line, color)
-    
-    def write(self, txt: object, new_line=True, color=None):
-        txt = str(txt)
-        if color:
-            txt = colored(txt, color)
         with self.write_lock:
             if self.read_lock.locked():
                 self.__clear_input()
-                sys.stdout.write(txt)
-                sys.stdout.write('\n')
+                for record in records:
+                    txt = record.message()
+                    sys.stdout.write(colored(txt, record.color) if record.color else txt)
+                    sys.stdout.write('\n')
                 with self.buffer_lock.for_read():
                     self.__write_input()
             else:
-                sys.stdout.write(txt)
-                if new_line:
-                    sys.stdout.write('\n')
+                for record in records:
+                    txt = record.message()
+                    sys.stdout.write(colored(txt, record.color) if record.color else txt)
+                    if record.new_line:
+                        sys.stdout.write('\n')
                 sys.stdout.flush()
                 self.last_line = ''
             self.last_writer_was_reader = False
 
+    def __write_file(self, records: List[LogRecord]):
+        if not records:
+            return
+        self.log_file.write(''.join(json.dumps({'time': record.time, 'level': LEVEL_NAMES.get(record.level, record.level),
+                                                'thread': record.thread, 'message': record.message()}) + '\n'
+                                    for record in records))
+        self.log_file.flush()
+
     def update_input_buffer(self, txt: str):
-        with self.buffer_lock.for_write():
-            self.read_buffer = txt
-        if self.read_lock.locked():
-            self.__write_input()
+        with self.write_lock:
+            with self.buffer_lock.for_write():
+                self.read_buffer = txt
+            if self.read_lock.locked():
+                self.__write_input()
 
     def interrupted_buffer(self):
         with self.buffer_lock.for_read():
@@ -330,24 +487,25 @@ class IO:
 
 
 class SilentIO(IO):
-    def write(self, txt: object, new_line=True, color=None):
-        pass
+    def __init__(self):
+        super().__init__()
+        self.set_level(SILENT)
 
 
 argv = sys.argv
 
 
 def get_arg(argname: str, cli_fallback=True, default=None):
-    for arg in argv:
-        if argname in arg:
-            v = arg.split('=')
+    for arg in argv[1:]:
+        v = arg.split('=', 1)
+        if v[0] == argname:
             return v[1] if len(v) > 1 else v
     return input(f"{argname}=") if cli_fallback else default
 
 
 def get_argflag(flagname: str, cli_fallback=False):
-    for arg in argv:
-        if flagname in arg:
+    for arg in argv[1:]:
+        if arg.split('=', 1)[0] == flagname:
             return True
     if cli_fallback:
         return input(f"{flagname}?(skip for no)=") != ""
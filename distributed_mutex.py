@@ -0,0 +1,254 @@
+import asyncio
+import copy
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+from cli_io import IO, SilentIO
+from membership import Address
+from node import Node
+
+
+class DistributedMutex:
+    """
+    a lock shared by a set of processes, used like threading.Lock:
+
+        mutex = DistributedMutex(our_port=8001, other_processes_ports=[8002, 8003])
+        with mutex:
+            ...  # no other process is inside a block of the same cluster
+
+    it owns the server socket, the Lamport clock and the waiting list, the protocol runs on an
+    event loop in a background thread. any number of local threads can call acquire(), they
+    go through the protocol one at a time. the critical section lasts until release().
+
+    locks with different keys are independent, named() returns the lock for another key that
+    shares this node and its connections:
+
+        with mutex.named('row-42'):
+            ...  # only excludes the holders of 'row-42'
+
+    the nodes can be on different hosts, known by id and host:port, and join a running cluster through seeds:
+
+        mutex = DistributedMutex(our_port=7000, other_processes_ports=[], node_id=4, host='0.0.0.0',
+                                 advertise=('10.0.0.4', 7000), seeds=[('10.0.0.1', 7000)])
+
+    with a cohort_budget a release that has another local thread waiting hands the critical section
+    straight to it, the node keeps its permissions and sends nothing: any number of times in a row while
+    no other node waits for the lock, at most cohort_budget times in a row otherwise. the deferred
+    replies go out when the node really releases. only an exclusive hold is handed over. with maekawa the
+    node can't see the other nodes waiting, it always releases after cohort_budget hand overs in a row
+
+    with ricart_agrawala the lock can also be taken in shared mode, any number of nodes can read
+    at once while a writer excludes everyone. local threads still go one at a time:
+
+        with mutex.for_read():
+            ...  # other processes may be reading too, nobody is writing
+
+    with trace=True the node keeps the spans of its last acquires, dump_trace() writes them for a trace viewer
+    """
+
+    def __init__(self, our_port: int, other_processes_ports: List[int], log: IO = None,
+                 request_timeout: Optional[float] = None, algorithm='ricart_agrawala', key='', metrics=False,
+                 metrics_port: Optional[int] = None, heartbeat_interval: Optional[float] = None,
+                 failure_timeout: Optional[float] = None, transport='tcp', node_id: Optional[int] = None,
+                 host='127.0.0.1', advertise: Optional[Address] = None, members: Optional[Dict[int, Address]] = None,
+                 seeds: Sequence[Address] = (), cohort_budget=0, trace=False, trace_capacity=65536):
+        self.log = log or SilentIO()
+        self.node = Node(our_port, other_processes_ports, log=self.log, request_timeout=request_timeout,
+                         algorithm=algorithm, metrics=metrics, metrics_port=metrics_port,
+                         heartbeat_interval=heartbeat_interval, failure_timeout=failure_timeout, transport=transport,
+                         node_id=node_id, host=host, advertise=advertise, members=members, seeds=seeds,
+                         trace=trace, trace_capacity=trace_capacity)
+        self.key = key
+        self.cohort_budget = cohort_budget
+        self._init_local()
+        self._named: Dict[str, DistributedMutex] = {key: self}  # shared by all the locks of this node
+        self._named_lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=f'DistributedMutex-{our_port}', daemon=True)
+        self._thread.start()
+        self._call(self.node.start())  # raises here if the port is taken or no seed answered
+
+    def _init_local(self):
+        self._local = threading.Lock()  # held by the local thread that is in (or entering) the critical section
+        self._cohort = threading.Lock()  # guards the waiter count and the hand over
+        self._waiting = 0  # local threads blocked in acquire()
+        self._handed_over = False  # the critical section was passed to the next local thread, not released
+        self._handoffs = 0  # hand overs since the node entered
+        self._shared = False  # the mode of the current hold
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    @property
+    def our_port(self):
+        return self.node.our_port
+
+    @property
+    def node_id(self):
+        return self.node.node_id
+
+    def named(self, key: str) -> 'DistributedMutex':
+        """
+        the lock for "key" on the same node, the same object is returned for the same key
+        """
+        with self._named_lock:
+            mutex = self._named.get(key)
+            if mutex is None:
+                mutex = copy.copy(self)
+                mutex.key = key
+                mutex._init_local()
+                self._named[key] = mutex
+            return mutex
+
+    def acquire(self, blocking=True, timeout: float = -1, shared=False) -> bool:
+        """
+        same arguments as threading.Lock.acquire, returns False if the lock was not acquired.
+        timeout -1 waits for request_timeout (forever if it is None).
+        a non-blocking acquire only succeeds when no message round is needed
+        (with roucairol_carvalho: when this node still holds every permission).
+        "shared" takes read access, see for_read()
+        """
+        if not blocking and timeout != -1:
+            raise ValueError("can't specify a timeout for a non-blocking call")
+        self.node.check_shared(shared)
+        deadline = time.monotonic() + timeout if timeout >= 0 else None
+        if not self._acquire_local(blocking, timeout):
+            return False
+        if self._handed_over:
+            # the previous local holder kept the node inside for us
+            self._handed_over = False
+            self._shared = False
+            return True
+        self._shared = shared
+        try:
+            if not blocking:
+                acquired = self._call(self._try_acquire(shared))
+            else:
+                remaining = max(deadline - time.monotonic(), 0) if deadline is not None else None
+                self._call(self.node.acquire(self.key, timeout=remaining, shared=shared))
+                acquired = True
+        except TimeoutError as e:
+            self.log.debug("acquire timed out: %s", e)
+            acquired = False
+        except BaseException:
+            self._local.release()
+            raise
+        if not acquired:
+            self._local.release()
+        return acquired
+
+    def _acquire_local(self, blocking: bool, timeout: float) -> bool:
+        locked = False
+        with self._cohort:
+            self._waiting += 1
+        try:
+            locked = self._local.acquire(blocking, timeout)
+        finally:
+            with self._cohort:
+                self._waiting -= 1
+                # we were the last waiter and the critical section was handed over to us, nobody will take it
+                orphaned = not locked and self._handed_over and self._waiting == 0 and self._local.acquire(False)
+            if orphaned:
+                self._handed_over = False
+                self._release_node()
+        return locked
+
+    def _release_node(self):
+        try:
+            self._call(self.node.release(self.key))
+        finally:
+            self._handoffs = 0
+            self._local.release()
+
+    async def _keep_for_cohort(self) -> bool:
+        return self.node.keep_for_local_waiter(self.key, self._handoffs, self.cohort_budget)
+
+    async def _shutdown(self):
+        await self.node.leave()
+        self.node.stop()
+        await self.node.serve()  # returns right away, closes the server and the connections
+
+    async def _try_acquire(self, shared: bool):
+        return self.node.try_acquire(self.key, shared)
+
+    def release(self):
+        if not self._local.locked():
+            raise RuntimeError("release unlocked DistributedMutex")
+        if self.cohort_budget and not self._shared:
+            with self._cohort:  # a waiter that gives up meanwhile would find nobody to take over from
+                if self._waiting and self._call(self._keep_for_cohort()):
+                    self._handoffs += 1
+                    self._handed_over = True
+                    self._local.release()
+                    return
+        self._release_node()
+
+    def locked(self) -> bool:
+        return self._local.locked()
+
+    def stats(self) -> str:
+        """
+        the node's metrics in the Prometheus text format, empty if it was created without metrics
+        """
+        return self._call(self._stats())
+
+    def dump_trace(self, path: str) -> int:
+        """
+        write the spans of the node (all keys) to "path" as trace-event JSON, see Tracer.dump.
+        returns how many spans were written, raises RuntimeError if the mutex was created without trace
+        """
+        if self.node.tracer is None:
+            raise RuntimeError("the DistributedMutex was created without trace=True")
+        return self.node.tracer.dump(path)
+
+    async def _stats(self):
+        return self.node.metrics.render() if self.node.metrics is not None else ''
+
+    def close(self):
+        """
+        leave the cluster, stop the server and close the peer connections, for the locks of all keys
+        """
+        if not self._loop.is_running():
+            return
+        self._call(self._shutdown())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def for_read(self) -> '_SharedMutex':
+        """
+        used for 'with' block, holds the lock in shared mode
+        """
+        return _SharedMutex(self)
+
+    def __enter__(self):
+        if not self.acquire():
+            raise TimeoutError(f"could not acquire the distributed mutex {self.key!r} within {self.node.request_timeout} seconds")
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.release()
+        if exc_type is not None:
+            return False  # exception happened
+        return True
+
+
+class _SharedMutex:
+    def __init__(self, mutex: DistributedMutex):
+        self.mutex = mutex
+
+    def __enter__(self):
+        if not self.mutex.acquire(shared=True):
+            raise TimeoutError(f"could not acquire the distributed mutex {self.mutex.key!r} for reading "
+                               f"within {self.mutex.node.request_timeout} seconds")
+        return self.mutex
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return self.mutex.__exit__(exc_type, exc_value, tb)
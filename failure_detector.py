@@ -0,0 +1,67 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Set
+
+from cli_io import IO
+
+
+class FailureDetector:
+    """
+    fixed-interval heartbeat detector: every "interval" seconds a heartbeat is sent to each peer,
+    a peer nothing was heard from (heartbeat or any other message) for "timeout" seconds is
+    suspected and on_down(peer) is called, on_up(peer) is called as soon as it is heard again.
+    peers get "timeout" seconds from the start before they can be suspected.
+    must be used from a single event loop
+    """
+
+    def __init__(self, peers: List[int], send_heartbeat: Callable[[int], None], on_down: Callable[[int], None],
+                 on_up: Callable[[int], None], log: IO, interval=0.5, timeout=2.0):
+        if timeout <= interval:
+            raise ValueError(f"the failure timeout ({timeout}s) must be longer than the heartbeat interval ({interval}s)")
+        self.peers = list(peers)
+        self.send_heartbeat = send_heartbeat
+        self.on_down = on_down
+        self.on_up = on_up
+        self.log = log
+        self.interval = interval
+        self.timeout = timeout
+        now = time.monotonic()
+        self.last_heard: Dict[int, float] = {p: now for p in peers}
+        self.down: Set[int] = set()
+
+    def add_peer(self, peer: int):
+        if peer not in self.peers:
+            self.peers.append(peer)
+            self.last_heard[peer] = time.monotonic()
+
+    def remove_peer(self, peer: int):
+        if peer in self.peers:
+            self.peers.remove(peer)
+        self.last_heard.pop(peer, None)
+        self.down.discard(peer)
+
+    def heard(self, peer: int):
+        self.last_heard[peer] = time.monotonic()
+        if peer in self.down:
+            self.down.discard(peer)
+            self.log.write("[failure detector] node %s is back", peer)
+            self.on_up(peer)
+
+    def check(self):
+        now = time.monotonic()
+        for peer in self.peers:
+            if peer not in self.down and now - self.last_heard.get(peer, now) > self.timeout:
+                self.down.add(peer)
+                self.log.warning("[failure detector] nothing from node %s for %.1f seconds, suspected down", peer,
+                                 now - self.last_heard[peer])
+                self.on_down(peer)
+
+    async def run(self):
+        now = time.monotonic()
+        for peer in self.peers:
+            self.last_heard[peer] = now  # the grace period starts when the node does
+        while True:
+            for peer in self.peers:
+                self.send_heartbeat(peer)
+            self.check()
+            await asyncio.sleep(self.interval)
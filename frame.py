@@ -0,0 +1,85 @@
+import struct
+from typing import Iterable, NamedTuple
+
+FRAME_VERSION = 2
+
+# every frame is: length of the rest (uint32), header, key, payload
+LENGTH = struct.Struct('<I')
+# version, message type, flags, sender id, lamport clock, key length
+HEADER = struct.Struct('<BBHIQH')
+# version 1 had no key, its frames are read as frames for the '' key
+HEADER_V1 = struct.Struct('<BBHIQ')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# first frame on every connection, identifies the connecting node, the payload is the "host:port" it listens on
+MESSAGE_TYPE_HELLO = 0
+# membership, not about any lock. the payload is a member list (membership.encode_members)
+MESSAGE_TYPE_JOIN = 252  # a node joins, sent to a seed which forwards it to the others
+MESSAGE_TYPE_MEMBERS = 253  # the seed's answer to a join: every member, the seed included
+MESSAGE_TYPE_LEAVE = 254  # the sender leaves the cluster, no payload
+# sent by the failure detector, not about any lock
+MESSAGE_TYPE_HEARTBEAT = 255
+
+
+class FrameError(ConnectionError):
+    """
+    the peer sent something that is not a frame we understand, the connection can't be trusted anymore
+    """
+    pass
+
+
+class Frame(NamedTuple):
+    type: int
+    sender: int
+    clock: int = 0
+    payload: bytes = b''
+    flags: int = 0
+    key: str = ''  # name of the lock the message is about
+
+
+def encode_frame(frame: Frame) -> bytes:
+    key = frame.key.encode('utf-8')
+    return LENGTH.pack(HEADER.size + len(key) + len(frame.payload)) \
+        + HEADER.pack(FRAME_VERSION, frame.type, frame.flags, frame.sender, frame.clock, len(key)) \
+        + key + frame.payload
+
+
+def encode_frames(frames: Iterable[Frame]) -> bytes:
+    """
+    several frames in one buffer so they go out with a single send
+    """
+    return b''.join(encode_frame(f) for f in frames)
+
+
+def frame_size(frame: Frame) -> int:
+    """
+    bytes taken by the encoded frame on the wire
+    """
+    return LENGTH.size + HEADER.size + len(frame.key.encode('utf-8')) + len(frame.payload)
+
+
+def decode_length(data) -> int:
+    length, = LENGTH.unpack(data)
+    if length < HEADER_V1.size or length > MAX_FRAME_SIZE:
+        raise FrameError(f"invalid frame length {length}")
+    return length
+
+
+def decode_frame(data) -> Frame:
+    """
+    decode the header and payload of a frame, "data" is everything after the length prefix
+    """
+    version = data[0]
+    if version == 1:
+        _, type, flags, sender, clock = HEADER_V1.unpack_from(data)
+        return Frame(type=type, sender=sender, clock=clock, payload=bytes(data[HEADER_V1.size:]), flags=flags)
+    if version != FRAME_VERSION:
+        raise FrameError(f"unsupported frame version {version}, expected {FRAME_VERSION}")
+    if len(data) < HEADER.size:
+        raise FrameError(f"frame of {len(data)} bytes is shorter than its header")
+    _, type, flags, sender, clock, key_length = HEADER.unpack_from(data)
+    payload_start = HEADER.size + key_length
+    if payload_start > len(data):
+        raise FrameError(f"key of {key_length} bytes does not fit in a frame of {len(data)} bytes")
+    key = str(data[HEADER.size:payload_start], 'utf-8')
+    return Frame(type=type, sender=sender, clock=clock, payload=bytes(data[payload_start:]), flags=flags, key=key)
@@ -1,135 +1,139 @@
-import _thread
-import datetime
-import socket as sockets
+import queue
+import signal
+import sys
+import threading
 import time
-from typing import List
-from BufferedSocketStream import BufferedSocketStream
+from typing import TextIO
+
 from cli_io import IO, get_arg, get_argflag
+from distributed_mutex import DistributedMutex
+from membership import load_cluster_file, parse_address
 from resource_type import *
 
 cli = IO()
-running = True
-
-waiting_nodes: List[BufferedSocketStream] = []
-aquired_permissions: List[BufferedSocketStream] = []
-
-MESSAGE_TYPE_PERMISSION_REQUEST = 1
-MESSAGE_TYPE_PERMISSION_GRANTED = 2
-
-text_to_commit = ''
-use_resource = False
-other_processes_ports = []
-
 
 less_verbose_flag = get_argflag('less_verbose')
 cli.ignore_debug(less_verbose_flag)
+log_file = get_arg("log_file", cli_fallback=False)
+if log_file:
+    cli.log_to_file(log_file)
 
 if get_argflag("use_db"):
     resource: Resource = MySQLResource(host='127.0.0.1', database='tp', user='root', password='toor', log=cli)
 else:
-    resource: Resource = FileResource(path='db.txt', log=cli)
-
-h = 0
-last_request_h = 0
-
-
-def request_resource():
-    global last_request_h, h, use_resource
-
-    h = h + 1
-    last_request_h = h
-
-    for p in other_processes_ports:
-        if not running:
-            break
-        cli.debug(f"will send MESSAGE(type=PERMISSION_REQUEST, port={our_port}, h={h}) to node {p}")
-        with BufferedSocketStream(p) as node:
-            node.send_int32(our_port)
-            node.send_int32(MESSAGE_TYPE_PERMISSION_REQUEST)
-            node.send_int32(h)
-    cli.write('Waiting for permission-replies')
-
-
-def read_stdin():
-    global use_resource, text_to_commit, running
-    try:
-        while running:
-            if not use_resource:
-                text_to_commit = cli.input(f"[node {our_port}] write to db: ", 'magenta')
-                use_resource = True
-                request_resource()
-            else:
-                time.sleep(.5)
-    except KeyboardInterrupt:
-        pass
-    finally:
-        running = False
-
-
-def handle_node_message(port: int, stream: BufferedSocketStream):
-    global h, use_resource
-    cli.debug(f'[thread handler for {port}] node {port} connected')
-    message_type = stream.read_int32()
-
-    if message_type == MESSAGE_TYPE_PERMISSION_REQUEST:
-        incoming_h = stream.read_int32()
-        h = max(h, incoming_h)
-        cli.debug(f"[thread handler for {port}] got MESSAGE(type=PERMISSION_REQUEST, port={port}, incoming_h={incoming_h}) from node {port}")
-        if (use_resource and last_request_h < incoming_h) or (use_resource and last_request_h == incoming_h and our_port < port):
-            cli.debug(f"[thread handler for {port}] adding {port} to wainting list")
-            waiting_nodes.append(port)
-        else:
-            cli.debug(f"[thread handler for {port}] will send MESSAGE(type=PERMISSION_GRANTED, port={our_port}) to node {port}")
-            with BufferedSocketStream(port) as node:
-                node.send_int32(our_port)
-                node.send_int32(MESSAGE_TYPE_PERMISSION_GRANTED)
-    elif message_type == MESSAGE_TYPE_PERMISSION_GRANTED:
-        cli.debug(f"[thread handler for {port}] got MESSAGE(type=PERMISSION_GRANTED, port={port}) from node {port}")
-        aquired_permissions.append(port)
-        if len(aquired_permissions) == len(other_processes_ports):
-            cli.debug('using resource')
-            resource.use(data=(port, text_to_commit), log=cli)
-            time.sleep(3)
-            use_resource = False
-            cli.debug(f'[thread handler for {port}] resoure released')
-            cli.debug(f'[thread handler for {port}] will send PERMISSION_GRANTED to waiting nodes ({len(waiting_nodes)})')
-            for p in waiting_nodes:
-                cli.debug(f"[thread handler for {port}] will send MESSAGE(type=PERMISSION_GRANTED, port={our_port}) to node {p}")
-                if not running:
-                    break
-                with BufferedSocketStream(p) as node:
-                    node.send_int32(our_port)
-                    node.send_int32(MESSAGE_TYPE_PERMISSION_GRANTED)
-            waiting_nodes.clear()
-            aquired_permissions.clear()
-    else:
-        cli.debug(f"[thread handler for {port}] got unkown message type: {message_type}")
-    stream.close()
+    resource: Resource = FileResource(path=get_arg("db_file", cli_fallback=False, default='db.bin'), log=cli,
+                                      fsync=get_arg("fsync", cli_fallback=False, default=FSYNC_NONE),
+                                      fsync_every=int(get_arg("fsync_every", cli_fallback=False, default=100)),
+                                      fsync_ms=float(get_arg("fsync_ms", cli_fallback=False, default=1000)))
+
+# lines waiting for the next critical section, a full queue blocks the reader until the resource catches up
+submissions: 'queue.Queue[str]' = queue.Queue(maxsize=int(get_arg("queue_size", cli_fallback=False, default=10000)))
+
+
+def read_stdin(mutex: DistributedMutex):
+    while True:
+        # returns right away, lines typed while waiting for permissions are written together
+        submissions.put(cli.input(f"[node {mutex.node_id}] write to db: ", 'magenta'))
+
 
+def read_lines(source: TextIO):
+    """
+    feed every line of a file, FIFO or piped stdin without the prompt, returns at end of input
+    once all the lines are written
+    """
+    count = 0
+    for line in source:
+        submissions.put(line.rstrip('\n'))
+        count = count + 1
+    submissions.join()
+    cli.write("end of input, %s lines submitted", count)
 
-our_port = int(get_arg("our_port"))
-other_processes_ports = [int(p) for p in get_arg("processes_ports").split(',')]
+
+def commit_loop(mutex: DistributedMutex, hold_time: float):
+    while True:
+        texts = [submissions.get()]
+        try:
+            with mutex:
+                # everything queued goes in this entry, at most queue_size lines (maxsize <= 0 is unbounded)
+                while submissions.maxsize <= 0 or len(texts) < submissions.maxsize:
+                    try:
+                        texts.append(submissions.get_nowait())
+                    except queue.Empty:
+                        break
+                resource.use_batch(items=[(mutex.node_id, text) for text in texts], log=cli)
+                time.sleep(hold_time)
+        except (ConnectionError, TimeoutError) as e:
+            cli.error("could not write %s lines: %s", len(texts), e)
+        finally:
+            for _ in texts:
+                submissions.task_done()
+
+
+cluster_file = get_arg("cluster", cli_fallback=False)
+seeds = [parse_address(s) for s in get_arg("seeds", cli_fallback=False, default='').split(',') if s]
+node_id = get_arg("node_id", cli_fallback=False)
+node_id = int(node_id) if node_id else None
+members = load_cluster_file(cluster_file) if cluster_file else None
+if members is not None and node_id is None:
+    node_id = int(get_arg("node_id"))
+if members is not None and node_id in members and not get_arg("our_port", cli_fallback=False):
+    our_port = members[node_id][1]
+else:
+    our_port = int(get_arg("our_port"))
+if members is not None or seeds:
+    other_processes_ports = []
+else:
+    other_processes_ports = [int(p) for p in get_arg("processes_ports").split(',')]
+host = get_arg("host", cli_fallback=False, default='127.0.0.1')
+advertise = get_arg("advertise", cli_fallback=False)
+if advertise is None and members is not None and node_id in members:
+    advertise = members[node_id]
+elif advertise is not None:
+    advertise = parse_address(advertise)
+request_timeout = get_arg("request_timeout", cli_fallback=False)
+hold_time = float(get_arg("hold_time", cli_fallback=False, default=0))
+algorithm = get_arg("algorithm", cli_fallback=False, default='ricart_agrawala')
+metrics_port = get_arg("metrics_port", cli_fallback=False)
+heartbeat = float(get_arg("heartbeat", cli_fallback=False, default=0.5))
+failure_timeout = get_arg("failure_timeout", cli_fallback=False)
+transport = get_arg("transport", cli_fallback=False, default='tcp')
+input_path = get_arg("input", cli_fallback=False, default=None if sys.stdin.isatty() else '-')
+trace_path = get_arg("trace", cli_fallback=False)
 
 # our_port = 8888
 # other_processes_ports = [8777,8886]
 
-server_socket = sockets.create_server(address=('127.0.0.1', our_port), family=sockets.AF_INET, backlog=10)
-_thread.start_new_thread(read_stdin, ())
-server_socket.settimeout(2)
+mutex = DistributedMutex(our_port, other_processes_ports, log=cli,
+                         request_timeout=float(request_timeout) if request_timeout else None, algorithm=algorithm,
+                         metrics_port=int(metrics_port) if metrics_port else None, heartbeat_interval=heartbeat or None,
+                         failure_timeout=float(failure_timeout) if failure_timeout else None, transport=transport,
+                         node_id=node_id, host=host, advertise=advertise, members=members, seeds=seeds,
+                         trace=bool(trace_path))
+
 
+def dump_trace(*_):
+    cli.write("%s spans written to %s", mutex.dump_trace(trace_path), trace_path)
+
+
+if trace_path:
+    resource = TracedResource(resource, mutex.node.tracer, key=mutex.key)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, dump_trace)  # kill -USR1 <pid> dumps the spans so far
 try:
-    cli.debug(f"[server] listening on {server_socket.getsockname()}")
-    while running:
-        try:
-            stream = BufferedSocketStream(server_socket.accept()[0])
-        except sockets.timeout:
-            continue
-        port = stream.read_int32()
-        cli.debug(f"[server] new connection from {port}")
-        _thread.start_new_thread(handle_node_message, (port, stream))
+    threading.Thread(target=commit_loop, args=(mutex, hold_time), daemon=True).start()
+    if input_path is None:
+        read_stdin(mutex)
+    else:
+        with (sys.stdin if input_path == '-' else open(input_path, 'r', buffering=1024 * 1024)) as source:
+            read_lines(source)
+        if not get_argflag("exit_at_eof"):
+            cli.write("still answering the other nodes, ctrl+c to stop")
+            threading.Event().wait()
 except KeyboardInterrupt:  # Ctrl+c
     pass
 finally:
-    server_socket.close()
+    mutex.close()
+    if trace_path:
+        dump_trace()
     resource.finalize(log=cli)
-    running = False
+    cli.flush()
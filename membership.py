@@ -0,0 +1,88 @@
+import socket as sockets
+import struct
+from typing import Collection, Dict, FrozenSet, Tuple
+
+Address = Tuple[str, int]
+
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+MEMBER_COUNT = struct.Struct('<I')
+MEMBER = struct.Struct('<IH')  # node id, length of the "host:port" that follows
+
+
+def parse_address(text: str, default_host='127.0.0.1') -> Address:
+    """
+    "host:port", "[v6 address]:port" or just "port" (on default_host)
+    """
+    text = text.strip()
+    host, separator, port = text.rpartition(':')
+    if not separator:
+        return default_host, int(text)
+    if host.startswith('[') and host.endswith(']'):
+        host = host[1:-1]
+    if not host:
+        raise ValueError(f"no host in address {text!r}")
+    return host, int(port)
+
+
+def format_address(address: Address) -> str:
+    host, port = address
+    return f'[{host}]:{port}' if ':' in host else f'{host}:{port}'
+
+
+def local_host_names() -> FrozenSet[str]:
+    """
+    the names of this host. getfqdn() may do a blocking reverse DNS lookup, call it once and keep the result
+    """
+    return frozenset(LOCAL_HOSTS + (sockets.gethostname(), sockets.getfqdn()))
+
+
+def is_local(address: Address, local_names: Collection[str] = LOCAL_HOSTS) -> bool:
+    """
+    whether "address" is this host (one of "local_names", see local_host_names()), a unix socket or
+    a shared memory ring can reach it
+    """
+    host = address[0]
+    return host in local_names or host.startswith('127.')
+
+
+def load_cluster_file(path: str) -> Dict[int, Address]:
+    """
+    one node per line: its id and the host:port it listens on, "#" starts a comment
+
+        # id  address
+        1     10.0.0.1:7000
+        2     10.0.0.2:7000
+    """
+    members: Dict[int, Address] = {}
+    with open(path, 'r') as f:
+        for number, line in enumerate(f, start=1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            try:
+                node_id, address = line.split()
+                members[int(node_id)] = parse_address(address)
+            except ValueError:
+                raise ValueError(f"{path}:{number}: expected '<id> <host:port>', got {line!r}") from None
+    return members
+
+
+def encode_members(members: Dict[int, Address]) -> bytes:
+    parts = [MEMBER_COUNT.pack(len(members))]
+    for node_id, address in members.items():
+        text = format_address(address).encode('utf-8')
+        parts.append(MEMBER.pack(node_id, len(text)) + text)
+    return b''.join(parts)
+
+
+def decode_members(payload: bytes) -> Dict[int, Address]:
+    count, = MEMBER_COUNT.unpack_from(payload)
+    offset = MEMBER_COUNT.size
+    members: Dict[int, Address] = {}
+    for _ in range(count):
+        node_id, length = MEMBER.unpack_from(payload, offset)
+        offset += MEMBER.size
+        members[node_id] = parse_address(bytes(payload[offset:offset + length]).decode('utf-8'))
+        offset += length
+    return members
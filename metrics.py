@@ -0,0 +1,157 @@
+import asyncio
+import bisect
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# seconds, from 100us to 10s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = '') -> str:
+    labels = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Gauge:
+    """
+    either set() by the code or read from "collect" when rendered, collect returns {label values: value}
+    """
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 collect: Callable[[], Dict[Tuple[str, ...], float]] = None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *label_values: str):
+        self.values[label_values] = value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        values = self.collect() if self.collect is not None else self.values
+        for label_values, value in sorted(values.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    """
+    fixed buckets, observe() is a bisect and two additions
+    """
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts (last one is +Inf), then sum
+
+    def observe(self, value: float, *label_values: str):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *label_values: str) -> int:
+        series = self.series.get(label_values)
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for label_values, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, label_values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, label_values)} {series[-1]}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, label_values)} {cumulative}')
+        return lines
+
+
+class Metrics:
+    """
+    a set of counters, gauges and histograms rendered in the Prometheus text format.
+    not thread safe: record and render from the node's event loop
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class NodeMetrics(Metrics):
+    """
+    what a Node records when metrics are enabled. a node without metrics has none of this
+    (node.metrics is None) and only pays an "is not None" check per message
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.acquire_wait = self.add(Histogram('dmutex_acquire_wait_seconds', 'time from request to entering the critical section', ('key',)))
+        self.hold = self.add(Histogram('dmutex_hold_seconds', 'time spent inside the critical section', ('key',)))
+        self.reply_latency = self.add(Histogram('dmutex_reply_latency_seconds', 'time from our request to the permission of a peer', ('peer',)))
+        self.messages_sent = self.add(Counter('dmutex_messages_sent_total', 'frames sent by message type', ('type',)))
+        self.bytes_sent = self.add(Counter('dmutex_bytes_sent_total', 'frame bytes sent by message type', ('type',)))
+        self.messages_received = self.add(Counter('dmutex_messages_received_total', 'frames received by message type', ('type',)))
+        self.bytes_received = self.add(Counter('dmutex_bytes_received_total', 'frame bytes received by message type', ('type',)))
+        self.clock_drift = self.add(Gauge('dmutex_clock_drift', 'lamport clock of the last message of a peer minus ours', ('peer',)))
+        self.cohort_handoffs = self.add(Counter('dmutex_cohort_handoffs_total', 'critical sections passed to another local thread without a release', ('key',)))
+
+    def add_gauge(self, name: str, help: str, labels: Sequence[str], collect: Callable[[], Dict[Tuple[str, ...], float]]):
+        self.add(Gauge(name, help, labels, collect=collect))
+
+
+async def serve_metrics(metrics: Metrics, host='127.0.0.1', port=9100) -> asyncio.AbstractServer:
+    """
+    answer every HTTP request on host:port with the metrics in the Prometheus text format
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while (await reader.readline()).strip():
+                pass  # request line and headers, the path does not matter
+            body = metrics.render().encode('utf-8')
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host=host, port=port)
@@ -0,0 +1,541 @@
+import asyncio
+import os
+import socket as sockets
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Type
+
+from algorithms import MESSAGE_TYPE_NAMES, MESSAGE_TYPE_PERMISSION_GRANTED, MutexAlgorithm, get_algorithm
+from BufferedSocketStream import AsyncBufferedSocketStream, start_server, start_unix_server
+from cli_io import IO
+from failure_detector import FailureDetector
+from frame import (MESSAGE_TYPE_HEARTBEAT, MESSAGE_TYPE_HELLO, MESSAGE_TYPE_JOIN, MESSAGE_TYPE_LEAVE,
+                   MESSAGE_TYPE_MEMBERS, Frame, frame_size)
+from membership import (Address, decode_members, encode_members, format_address, is_local, local_host_names,
+                        parse_address)
+from metrics import NodeMetrics, serve_metrics
+from peer_pool import PeerPool
+from shared_memory_stream import AsyncSharedMemoryStream, start_ring_server
+from tracing import Tracer
+
+TRANSPORTS = ('tcp', 'unix', 'shm')
+MEMBERSHIP_MESSAGE_TYPES = (MESSAGE_TYPE_JOIN, MESSAGE_TYPE_MEMBERS, MESSAGE_TYPE_LEAVE)
+
+
+def local_socket_path(port: int, transport: str) -> str:
+    """
+    where the node listening on "port" accepts "unix" or "shm" connections from the same host
+    """
+    return os.path.join(tempfile.gettempdir(), f'dmutex-{port}.{transport}.sock')
+
+
+class Node:
+    """
+    runs a MutexAlgorithm (Ricart & Agrawala by default) on a single asyncio event loop,
+    see DistributedMutex for the blocking api.
+    the accept loop, the message handlers and the sends are all on that loop,
+    so the protocol state is only touched by one thread and needs no locks.
+    a node guards any number of named locks ("keys"), each with its own algorithm state
+    (clock, deferred replies, granted set), all multiplexed over the same peer connections.
+    a lock's state is created the first time it is used or a message about it arrives.
+    with metrics=True the node records latencies, message counts and queue depths in self.metrics,
+    served in the Prometheus text format on metrics_port if one is given.
+    with a heartbeat_interval the node sends heartbeats and suspects the peers it heard nothing from
+    for failure_timeout seconds (default 4 intervals): the algorithms stop waiting for their replies,
+    and an acquire that can't be granted without a suspected peer fails right away.
+    a node is known to the others by node_id (default our_port) and reached at "advertise"
+    (default host:our_port, "host" is the address the server binds). its peers are "members"
+    ({id: (host, port)}), or other_processes_ports on 127.0.0.1 with their port as id.
+    with "seeds" the node joins a running cluster when it starts: the first seed that answers sends it the
+    members and tells them about it. leave() tells the others we are going. joining and leaving need an
+    algorithm that supports membership changes (ricart_agrawala, roucairol_carvalho), the others need
+    every node listed from the start.
+    "transport" is how the node talks to the peers on the same host: "tcp", "unix" (unix domain sockets)
+    or "shm" (shared memory rings, see AsyncSharedMemoryStream). remote peers are always reached over TCP
+    and the node also listens on TCP, every node of a host must use the same transport.
+    with trace=True the node keeps the last trace_capacity spans of its acquires in self.tracer: the whole
+    acquire, the request, each peer's permission, the handling of every message, the hold, the release
+    (which sends the deferred replies) and the connects, see Tracer.dump
+    """
+
+    def __init__(self, our_port: int, other_processes_ports: List[int], log: IO, request_timeout: Optional[float] = None,
+                 algorithm='ricart_agrawala', metrics=False, metrics_port: Optional[int] = None,
+                 heartbeat_interval: Optional[float] = None, failure_timeout: Optional[float] = None,
+                 transport='tcp', node_id: Optional[int] = None, host='127.0.0.1', advertise: Optional[Address] = None,
+                 members: Optional[Dict[int, Address]] = None, seeds: Sequence[Address] = (), trace=False,
+                 trace_capacity=65536):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"unknown transport {transport}, expected one of {', '.join(TRANSPORTS)}")
+        self.our_port = our_port  # the port we listen on
+        self.node_id = our_port if node_id is None else node_id
+        self.host = host
+        self.local_names = local_host_names()  # looked up here, not on the event loop
+        if advertise is None:
+            advertise = (sockets.gethostname() if host in ('', '0.0.0.0', '::') else host, our_port)
+        self.advertise = advertise
+        self.transport = transport
+        if members is None:
+            members = {p: ('127.0.0.1', p) for p in other_processes_ports}
+        self.addresses: Dict[int, Address] = {p: a for p, a in members.items() if p != self.node_id}
+        self.peer_ids: List[int] = list(self.addresses)
+        self.seeds = list(seeds)
+        self.log = log
+        self.request_timeout = request_timeout  # seconds to wait for all permissions, None waits forever
+        self.algorithm: Type[MutexAlgorithm] = get_algorithm(algorithm)
+        if self.seeds and not self.algorithm.supports_membership_changes:
+            raise ValueError(f"{algorithm} needs a fixed set of nodes, list them all instead of joining through seeds")
+        self.locks: Dict[str, MutexAlgorithm] = {}  # only the keys that are not idle, see drop_if_idle
+        self.dropped_clock = 0  # the highest clock and grant count of the dropped instances
+        self.dropped_grants = 0
+        self.permissions_complete: Dict[str, asyncio.Event] = {}  # keys with a pending acquire()
+        self.peers = PeerPool(self.node_id, on_message=self.handle_node_message, on_error=self.on_peer_error,
+                              connect=self.connect, hello=format_address(advertise).encode('utf-8'))
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.local_server: Optional[asyncio.AbstractServer] = None  # the unix socket of "unix" and "shm"
+        self.stopped: Optional[asyncio.Event] = None
+        self.metrics: Optional[NodeMetrics] = None
+        self.metrics_port = metrics_port
+        self.metrics_server: Optional[asyncio.AbstractServer] = None
+        self.requested_at: Dict[str, float] = {}  # keys with a pending request, only kept with metrics
+        self.entered_at: Dict[str, float] = {}
+        self.acquire_errors: Dict[str, BaseException] = {}  # why a pending acquire() can't succeed
+        self.tracer: Optional[Tracer] = Tracer(self.node_id, trace_capacity) if trace else None
+        self.traced_requests: Dict[str, int] = {}  # when the pending request of a key was sent, only kept with a tracer
+        self.traced_entries: Dict[str, int] = {}
+        self.detector: Optional[FailureDetector] = None
+        self.detector_task: Optional[asyncio.Task] = None
+        if heartbeat_interval:
+            self.detector = FailureDetector(self.peer_ids, send_heartbeat=self.send_heartbeat,
+                                            on_down=self.on_peer_down, on_up=self.on_peer_up, log=log,
+                                            interval=heartbeat_interval, timeout=failure_timeout or heartbeat_interval * 4)
+        if metrics or metrics_port is not None:
+            self.metrics = NodeMetrics()
+            self.metrics.add_gauge('dmutex_queue_length', 'requests of other nodes held back', ('key',),
+                                   lambda: {(key, ): lock.queue_length() for key, lock in self.locks.items()})
+            self.metrics.add_gauge('dmutex_lamport_clock', 'our lamport clock', ('key',),
+                                   lambda: {(key, ): lock.h for key, lock in self.locks.items()})
+            self.metrics.add_gauge('dmutex_pending_frames', 'frames waiting for a connection', (),
+                                   lambda: {(): sum(len(frames) for frames in self.peers.pending.values())})
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.server = await start_server(self.accept, host=self.host, port=self.our_port, backlog=128)
+        self.log.debug("[server] listening on %s", self.server.sockets[0].getsockname())
+        if self.transport != 'tcp':
+            path = local_socket_path(self.our_port, self.transport)
+            start_local = start_unix_server if self.transport == 'unix' else start_ring_server
+            self.local_server = await start_local(self.accept, path, backlog=128)
+            self.log.debug("[server] listening on %s (%s)", path, self.transport)
+        if self.metrics_port is not None:
+            self.metrics_server = await serve_metrics(self.metrics, port=self.metrics_port)
+            self.log.debug("[server] metrics on http://127.0.0.1:%s/metrics", self.metrics_port)
+        if self.seeds:
+            await self.join()
+        if self.detector is not None:
+            self.detector_task = self.loop.create_task(self.detector.run())
+
+    async def serve(self):
+        """
+        run until stop() is called
+        """
+        if self.server is None:
+            await self.start()
+        try:
+            await self.stopped.wait()
+        finally:
+            if self.detector_task is not None:
+                self.detector_task.cancel()
+            self.server.close()
+            if self.metrics_server is not None:
+                self.metrics_server.close()
+            self.peers.close()
+            await self.peers.wait_closed()
+            await self.server.wait_closed()
+            if self.local_server is not None:
+                self.local_server.close()
+                await self.local_server.wait_closed()
+                try:
+                    os.unlink(local_socket_path(self.our_port, self.transport))
+                except FileNotFoundError:
+                    pass
+
+    def stop(self):
+        if self.stopped is not None:
+            self.stopped.set()
+
+    def stop_threadsafe(self):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stop)
+
+    async def connect(self, node: int) -> AsyncBufferedSocketStream:
+        """
+        open a connection to "node", the transport depends on whether its address is on this host
+        """
+        address = self.addresses.get(node)
+        if address is None:
+            raise ConnectionError(f"no address for node {node}, it is not a member")
+        if self.tracer is not None:
+            with self.tracer.span('connect', f'peer {node}', peer=node, address=format_address(address),
+                                  transport=self.transport if is_local(address, self.local_names) else 'tcp'):
+                return await self.open_connection(address)
+        return await self.open_connection(address)
+
+    async def open_connection(self, address: Address) -> AsyncBufferedSocketStream:
+        if self.transport != 'tcp' and is_local(address, self.local_names):
+            path = local_socket_path(address[1], self.transport)
+            if self.transport == 'unix':
+                return await AsyncBufferedSocketStream.connect(path)
+            return await AsyncSharedMemoryStream.connect(path)
+        return await AsyncBufferedSocketStream.connect(address)
+
+    async def accept(self, stream: AsyncBufferedSocketStream):
+        try:
+            hello = await stream.read_frame()
+        except ConnectionError:
+            stream.close()
+            return
+        if hello.type != MESSAGE_TYPE_HELLO:
+            self.log.debug("[server] connection did not start with HELLO, got message type %s", hello.type)
+            stream.close()
+            return
+        node = hello.sender
+        self.log.debug("[server] new connection from %s", node)
+        if hello.payload:
+            try:
+                address = parse_address(bytes(hello.payload).decode('utf-8'))
+            except ValueError:
+                self.log.debug("[server] bad address in the HELLO of node %s: %r", node, bytes(hello.payload))
+            else:
+                if node in self.addresses or self.algorithm.supports_membership_changes:
+                    # a node that restarted, moved or that we did not hear joining yet
+                    self.add_peer(node, address)
+        self.peers.adopt(node, stream)
+
+    def send(self, port: int, frame: Frame):
+        if self.metrics is not None:
+            message_type = MESSAGE_TYPE_NAMES.get(frame.type, str(frame.type))
+            self.metrics.messages_sent.inc(message_type)
+            self.metrics.bytes_sent.inc(message_type, amount=frame_size(frame))
+        self.peers.post(port, frame)
+
+    def send_heartbeat(self, port: int):
+        self.peers.post(port, Frame(MESSAGE_TYPE_HEARTBEAT, sender=self.node_id))
+
+    def lock(self, key='') -> MutexAlgorithm:
+        algorithm = self.locks.get(key)
+        if algorithm is None:
+            algorithm = self.locks[key] = self.algorithm(self.node_id, list(self.peer_ids), send=self.send,
+                                                         entered=lambda: self.entered(key), log=self.log, key=key)
+            algorithm.resume(self.dropped_clock, self.dropped_grants)
+            if self.detector is not None:
+                for port in self.detector.down:
+                    algorithm.on_peer_down(port)
+        return algorithm
+
+    def drop_if_idle(self, key: str):
+        """
+        forget the state of "key" once it holds nothing, so that keys used only now and then, also the ones
+        named in the frames of other nodes, do not pile up. lock() starts it again where it was
+        """
+        algorithm = self.locks.get(key)
+        if algorithm is None or key in self.permissions_complete or not algorithm.idle():
+            return
+        self.dropped_clock = max(self.dropped_clock, algorithm.h)
+        self.dropped_grants = max(self.dropped_grants, algorithm.grants())
+        del self.locks[key]
+
+    def entered(self, key: str):
+        if self.metrics is not None:
+            now = time.monotonic()
+            self.entered_at[key] = now
+            requested_at = self.requested_at.pop(key, None)
+            if requested_at is not None:
+                self.metrics.acquire_wait.observe(now - requested_at, key)
+        if self.tracer is not None:
+            self.traced_entries[key] = self.tracer.now()
+        event = self.permissions_complete.get(key)
+        if event is not None:
+            event.set()
+
+    def check_shared(self, shared: bool):
+        if shared and not self.algorithm.supports_shared:
+            raise ValueError(f"{self.algorithm.name} has no shared (read) mode")
+
+    def try_acquire(self, key='', shared=False) -> bool:
+        """
+        enter the critical section of "key" only if that needs no message round
+        """
+        self.check_shared(shared)
+        algorithm = self.lock(key)
+        if not algorithm.can_enter_without_messages():
+            self.drop_if_idle(key)
+            return False
+        if self.metrics is not None:
+            self.requested_at[key] = time.monotonic()
+        if self.tracer is not None:
+            self.traced_requests[key] = self.tracer.now()
+        algorithm.request(shared)
+        return algorithm.in_cs
+
+    async def acquire(self, key='', timeout: Optional[float] = None, shared=False):
+        """
+        request the critical section of "key" and wait until the algorithm lets us in.
+        the requests go to all nodes at once, so the wait is bounded by the slowest node
+        instead of the sum of all of them.
+        "shared" asks for read access, held together with the other readers but never with a writer.
+        raises TimeoutError after "timeout" seconds (default request_timeout), the request is withdrawn then.
+        raises ConnectionError as soon as the request needs a peer that is suspected down
+        """
+        self.check_shared(shared)
+        if timeout is None:
+            timeout = self.request_timeout
+        algorithm = self.lock(key)
+        event = self.permissions_complete[key] = asyncio.Event()
+        if self.metrics is not None:
+            self.requested_at[key] = time.monotonic()
+        if self.tracer is None:
+            algorithm.request(shared)
+        else:
+            start = self.traced_requests[key] = self.tracer.now()
+            algorithm.request(shared)
+            self.tracer.record('request', f'lock {key!r}', start, key=key, clock=algorithm.h, shared=shared,
+                               peers=len(self.peer_ids))
+        self.check_down(key)
+        outcome = 'error'
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            error = self.acquire_errors.pop(key, None)
+            if error is not None:
+                raise error
+            outcome = 'entered'
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            missing = algorithm.missing()
+            await self.release(key)
+            raise TimeoutError(f"no permission-reply from {missing} for {key!r} after {timeout} seconds") from None
+        except BaseException:
+            await self.release(key)
+            raise
+        finally:
+            if self.tracer is not None:
+                self.tracer.record('acquire', f'lock {key!r}', start, key=key, clock=algorithm.h, shared=shared,
+                                   outcome=outcome)
+        self.log.debug('using resource %r', key)
+
+    def check_down(self, key: str):
+        """
+        fail the pending acquire of "key" if it can't be granted while some peers are down
+        """
+        event = self.permissions_complete.get(key)
+        if event is None or event.is_set():
+            return
+        down = self.locks[key].waits_for_down()
+        if down:
+            self.acquire_errors[key] = ConnectionError(f"can't acquire {key!r} while nodes {down} are down")
+            event.set()
+
+    def on_peer_down(self, port: int):
+        for algorithm in list(self.locks.values()):
+            algorithm.on_peer_down(port)
+        for key in list(self.permissions_complete):
+            self.check_down(key)
+
+    def on_peer_up(self, port: int):
+        for algorithm in list(self.locks.values()):
+            algorithm.on_peer_up(port)
+
+    async def release(self, key=''):
+        self.permissions_complete.pop(key, None)
+        self.acquire_errors.pop(key, None)
+        if self.metrics is not None:
+            self.requested_at.pop(key, None)
+            entered_at = self.entered_at.pop(key, None)
+            if entered_at is not None:
+                self.metrics.hold.observe(time.monotonic() - entered_at, key)
+        if self.tracer is None:
+            self.lock(key).release()
+        else:
+            self.traced_release(key)
+        self.drop_if_idle(key)
+
+    def traced_release(self, key: str):
+        algorithm = self.lock(key)
+        track = f'lock {key!r}'
+        self.traced_requests.pop(key, None)
+        entered_at = self.traced_entries.pop(key, None)
+        start = self.tracer.now()
+        if entered_at is not None:
+            self.tracer.record('hold', track, entered_at, start, key=key, clock=algorithm.h)
+        deferred = algorithm.queue_length()
+        algorithm.release()
+        self.tracer.record('release', track, start, key=key, clock=algorithm.h, deferred=deferred)
+
+    def keep_for_local_waiter(self, key: str, handoffs: int, budget: int) -> bool:
+        """
+        whether the critical section of "key" may go to another local thread instead of being released:
+        always while no other node waits for it, "budget" hand overs in a row otherwise.
+        when the algorithm can't tell whether other nodes wait (maekawa) it is always "budget" in a row
+        """
+        algorithm = self.locks.get(key)
+        if algorithm is None or not algorithm.in_cs:
+            return False
+        if handoffs >= budget and (algorithm.queue_length() > 0 or not algorithm.sees_remote_waiters):
+            return False
+        if self.metrics is not None:
+            self.metrics.cohort_handoffs.inc(key)
+        return True
+
+    async def handle_node_message(self, port: int, frame: Frame):
+        if self.detector is not None:
+            self.detector.heard(port)
+        if frame.type == MESSAGE_TYPE_HEARTBEAT:
+            return
+        if frame.type in MEMBERSHIP_MESSAGE_TYPES:
+            self.on_membership_message(port, frame)
+            return
+        algorithm = self.lock(frame.key)
+        if self.metrics is not None:
+            self.record_received(port, frame, algorithm)
+        if self.tracer is None:
+            algorithm.on_message(port, frame)
+        else:
+            self.traced_message(port, frame, algorithm)
+        self.drop_if_idle(frame.key)
+
+    def traced_message(self, port: int, frame: Frame, algorithm: MutexAlgorithm):
+        message_type = MESSAGE_TYPE_NAMES.get(frame.type, str(frame.type))
+        start = self.tracer.now()
+        requested_at = self.traced_requests.get(frame.key)
+        if frame.type == MESSAGE_TYPE_PERMISSION_GRANTED and requested_at is not None:
+            # from our request to this node's reply, the slowest peer is the last of these to end
+            self.tracer.record('permission', f'peer {port}', requested_at, start, peer=port, key=frame.key,
+                               clock=frame.clock)
+        algorithm.on_message(port, frame)
+        self.tracer.record(f'handle {message_type}', 'messages', start, peer=port, key=frame.key, clock=frame.clock,
+                           our_clock=algorithm.h)
+
+    def record_received(self, port: int, frame: Frame, algorithm: MutexAlgorithm):
+        message_type = MESSAGE_TYPE_NAMES.get(frame.type, str(frame.type))
+        self.metrics.messages_received.inc(message_type)
+        self.metrics.bytes_received.inc(message_type, amount=frame_size(frame))
+        self.metrics.clock_drift.set(frame.clock - algorithm.h, str(port))
+        requested_at = self.requested_at.get(frame.key)
+        if frame.type == MESSAGE_TYPE_PERMISSION_GRANTED and requested_at is not None:
+            self.metrics.reply_latency.observe(time.monotonic() - requested_at, str(port))
+
+    # membership
+
+    async def join(self, timeout=5.0):
+        """
+        ask the seeds in turn until one answers with the members of the cluster.
+        a node that is its own seed starts a new cluster when no other seed answers
+        """
+        join = Frame(MESSAGE_TYPE_JOIN, sender=self.node_id, payload=encode_members({self.node_id: self.advertise}))
+        errors = []
+        founder = False
+        for seed in self.seeds:
+            if seed == self.advertise or (is_local(seed, self.local_names) and seed[1] == self.our_port):
+                founder = True
+                continue
+            try:
+                stream = await asyncio.wait_for(AsyncBufferedSocketStream.connect(seed), timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                errors.append(f"{format_address(seed)}: {e or 'timed out'}")
+                continue
+            try:
+                stream.send_frames((Frame(MESSAGE_TYPE_HELLO, sender=self.node_id, payload=self.peers.hello), join))
+                frame, early = await asyncio.wait_for(self.read_members(stream), timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                stream.close()
+                errors.append(f"{format_address(seed)}: {e or 'no answer'}")
+                continue
+            for node, address in decode_members(frame.payload).items():
+                self.add_peer(node, address)
+            self.peers.adopt(frame.sender, stream)
+            for message in early:
+                await self.handle_node_message(frame.sender, message)
+            self.log.write("[membership] joined through node %s, %s members", frame.sender, len(self.peer_ids) + 1)
+            return
+        if not founder:
+            raise ConnectionError(f"could not join the cluster, no seed answered: {'; '.join(errors)}")
+        self.log.write("[membership] no other seed answered, starting a new cluster")
+
+    @staticmethod
+    async def read_members(stream: AsyncBufferedSocketStream) -> Tuple[Frame, List[Frame]]:
+        """
+        the MEMBERS answer of a seed, and what it sent before (it may already be asking us for a lock)
+        """
+        early = []
+        while True:
+            frame = await stream.read_frame()
+            if frame.type == MESSAGE_TYPE_MEMBERS:
+                return frame, early
+            early.append(frame)
+
+    async def leave(self, timeout=2.0):
+        """
+        tell every peer we are leaving, they stop waiting for us. call it with no lock held or requested
+        """
+        if not self.algorithm.supports_membership_changes or not self.peer_ids:
+            return
+        frame = Frame(MESSAGE_TYPE_LEAVE, sender=self.node_id)
+        sends = [self.peers.send(p, frame) for p in self.peer_ids]
+        try:
+            await asyncio.wait_for(asyncio.gather(*sends, return_exceptions=True), timeout)
+        except asyncio.TimeoutError:
+            self.log.debug("[membership] some peers did not get our LEAVE in %s seconds", timeout)
+
+    def add_peer(self, node: int, address: Address):
+        """
+        a node joined, or a known node is at a new address
+        """
+        if node == self.node_id:
+            return
+        known = node in self.addresses
+        self.addresses[node] = address
+        if known:
+            return
+        self.peer_ids.append(node)
+        self.log.write("[membership] node %s joined at %s", node, format_address(address))
+        if self.detector is not None:
+            self.detector.add_peer(node)
+        for algorithm in list(self.locks.values()):
+            algorithm.add_peer(node)
+
+    def remove_peer(self, node: int):
+        if node not in self.addresses:
+            return
+        del self.addresses[node]
+        self.peer_ids.remove(node)
+        self.log.write("[membership] node %s left", node)
+        if self.detector is not None:
+            self.detector.remove_peer(node)
+        self.peers.forget(node)
+        for algorithm in list(self.locks.values()):
+            algorithm.remove_peer(node)
+
+    def on_membership_message(self, port: int, frame: Frame):
+        if not self.algorithm.supports_membership_changes:
+            self.log.warning("[membership] ignoring a membership change from node %s, %s needs a fixed set of nodes",
+                             port, self.algorithm.name)
+            return
+        if frame.type == MESSAGE_TYPE_LEAVE:
+            self.remove_peer(frame.sender)
+            return
+        members = decode_members(frame.payload)
+        for node, address in members.items():
+            self.add_peer(node, address)
+        if frame.type == MESSAGE_TYPE_JOIN and frame.sender in members:
+            # asked by the joining node itself: answer it and tell everyone else
+            everyone = dict(self.addresses)
+            everyone[self.node_id] = self.advertise
+            self.peers.post(port, Frame(MESSAGE_TYPE_MEMBERS, sender=self.node_id, payload=encode_members(everyone)))
+            forward = Frame(MESSAGE_TYPE_JOIN, sender=self.node_id, payload=frame.payload)
+            for p in self.peer_ids:
+                if p not in members:
+                    self.peers.post(p, forward)
+
+    def on_peer_error(self, port: int, e: BaseException):
+        self.log.debug("[handler for %s] connection lost: %s", port, e)
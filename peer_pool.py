@@ -0,0 +1,196 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from BufferedSocketStream import AsyncBufferedSocketStream
+from frame import MESSAGE_TYPE_HEARTBEAT, MESSAGE_TYPE_HELLO, Frame
+
+
+class PeerPool:
+    """
+    keeps one long-lived connection per peer instead of a connect per message.
+    connections are opened lazily on the first send and are used in both directions:
+    a connection accepted from a peer is also used to send to it.
+    every pooled connection gets a reader task that awaits on_message(peer, frame) for each frame.
+    "connect" opens the connection to a peer (TCP by default), see Node.connect for the local transports.
+    frames posted to a peer that can't be reached are kept and sent once it is: the connect is retried
+    every max_retry_delay seconds at most, and right away when the peer connects to us. forget() drops them.
+    must be used from a single event loop.
+    """
+
+    def __init__(self, node_id: int, on_message: Callable[[int, Frame], Awaitable[None]],
+                 reconnect_attempts=5, on_error: Callable[[int, BaseException], None] = None, reconnect_delay=0.05,
+                 connect: Optional[Callable[[int], Awaitable[AsyncBufferedSocketStream]]] = None, hello=b'',
+                 max_retry_delay=1.0):
+        self.node_id = node_id
+        self.hello = hello  # payload of our HELLO, the address we listen on
+        self.connect = connect or AsyncBufferedSocketStream.connect
+        self.on_message = on_message
+        self.on_error = on_error
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay  # seconds before the second attempt, doubled after each one
+        self.streams: Dict[int, AsyncBufferedSocketStream] = {}
+        self.connect_locks: Dict[int, asyncio.Lock] = {}
+        self.readers: Set[asyncio.Task] = set()  # also holds the tasks flushing posted frames
+        self.max_retry_delay = max_retry_delay  # seconds between two rounds of connects to an unreachable peer
+        self.pending: Dict[int, List[Frame]] = {}  # frames posted while there is no connection yet
+        self.flushing: Dict[int, asyncio.Event] = {}  # peers with a flush task, set to retry it right away
+        self.closed = False
+
+    async def _connect(self, peer: int) -> AsyncBufferedSocketStream:
+        attempts = self.reconnect_attempts
+        delay = self.reconnect_delay
+        while True:
+            try:
+                stream = await self.connect(peer)
+                break
+            except OSError as e:
+                attempts = attempts - 1
+                if attempts <= 0:
+                    raise ConnectionError(f"attempted to connect {self.reconnect_attempts} times but node {peer} did not respond: {str(e)}") from e
+                # the peer may be starting or its accept backlog full, don't burn the attempts at once
+                await asyncio.sleep(delay)
+                delay = delay * 2
+        stream.send_frame(Frame(MESSAGE_TYPE_HELLO, sender=self.node_id, payload=self.hello))
+        return stream
+
+    async def get(self, peer: int) -> AsyncBufferedSocketStream:
+        """
+        return the connection to "peer", connect if there is none
+        """
+        stream = self.streams.get(peer)
+        if stream is not None:
+            return stream
+        # the lock is fifo so senders waiting on the same connect keep their order
+        lock = self.connect_locks.setdefault(peer, asyncio.Lock())
+        async with lock:
+            stream = self.streams.get(peer)
+            if stream is not None:
+                return stream
+            stream = await self._connect(peer)
+            if peer in self.streams:
+                # the peer connected to us while we were connecting, keep a single connection for sending
+                # but still listen on ours, the peer has it registered now
+                self._start_reader(peer, stream)
+                return self.streams[peer]
+            self.streams[peer] = stream
+            self._start_reader(peer, stream)
+            return stream
+
+    def adopt(self, peer: int, stream: AsyncBufferedSocketStream):
+        """
+        register a connection accepted from "peer" (handshake already read) and start reading from it
+        """
+        if peer not in self.streams:
+            self.streams[peer] = stream
+        self._start_reader(peer, stream)
+        retry = self.flushing.get(peer)
+        if retry is not None:
+            retry.set()  # it is up, send what waits for it now
+
+    def post(self, peer: int, frame: Frame):
+        """
+        send without waiting: written right away when connected, otherwise by a task that connects first.
+        frames posted to the same peer keep their order. errors are reported to on_error
+        """
+        stream = self.streams.get(peer)
+        if stream is not None and not self.pending.get(peer):
+            try:
+                stream.send_frame(frame)
+                return
+            except ConnectionError:
+                self.drop(peer, stream)
+        self.pending.setdefault(peer, []).append(frame)
+        if peer not in self.flushing:
+            self.flushing[peer] = asyncio.Event()
+            task = asyncio.get_running_loop().create_task(self._flush(peer))
+            self.readers.add(task)
+            task.add_done_callback(self.readers.discard)
+
+    async def _flush(self, peer: int):
+        retry = self.flushing[peer]
+        delay = self.reconnect_delay
+        try:
+            while self.pending.get(peer) and not self.closed:
+                frames = list(self.pending[peer])
+                try:
+                    await self.send_frames(peer, frames)
+                except (OSError, ConnectionError) as e:
+                    if self.closed:
+                        return
+                    if self.on_error is not None:
+                        self.on_error(peer, e)
+                    # keep the frames for when the peer is back, a heartbeat is only worth sending fresh
+                    if peer in self.pending:
+                        self.pending[peer] = [f for f in self.pending[peer] if f.type != MESSAGE_TYPE_HEARTBEAT]
+                    retry.clear()
+                    try:
+                        await asyncio.wait_for(retry.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    delay = min(delay * 2, self.max_retry_delay)
+                    continue
+                delay = self.reconnect_delay
+                # frames posted while sending are sent by the next round
+                if peer in self.pending:
+                    del self.pending[peer][:len(frames)]
+        finally:
+            del self.flushing[peer]
+
+    def forget(self, peer: int):
+        """
+        drop the frames waiting for "peer", it left the cluster
+        """
+        self.pending.pop(peer, None)
+        retry = self.flushing.get(peer)
+        if retry is not None:
+            retry.set()
+
+    async def send(self, peer: int, frame: Frame):
+        await self.send_frames(peer, (frame,))
+
+    async def send_frames(self, peer: int, frames: Iterable[Frame]):
+        """
+        send frames to "peer" in one write, reconnects once if the pooled connection is broken
+        """
+        frames = tuple(frames)
+        for retry in (True, False):
+            stream = await self.get(peer)
+            try:
+                stream.send_frames(frames)
+                await stream.drain()
+                return
+            except (OSError, ConnectionError):
+                self.drop(peer, stream)
+                if not retry:
+                    raise
+
+    def drop(self, peer: int, stream: AsyncBufferedSocketStream):
+        if self.streams.get(peer) is stream:
+            del self.streams[peer]
+        stream.close()
+
+    def _start_reader(self, peer: int, stream: AsyncBufferedSocketStream):
+        task = asyncio.get_running_loop().create_task(self._serve(peer, stream))
+        self.readers.add(task)
+        task.add_done_callback(self.readers.discard)
+
+    async def _serve(self, peer: int, stream: AsyncBufferedSocketStream):
+        try:
+            while not self.closed:
+                await self.on_message(peer, await stream.read_frame())
+        except (OSError, ConnectionError) as e:
+            if not self.closed and self.on_error is not None:
+                self.on_error(peer, e)
+        finally:
+            self.drop(peer, stream)
+
+    def close(self):
+        self.closed = True
+        for stream in list(self.streams.values()):
+            stream.close()
+        self.streams.clear()
+        for task in list(self.readers):
+            task.cancel()
+
+    async def wait_closed(self):
+        await asyncio.gather(*self.readers, return_exceptions=True)
@@ -1,59 +1,320 @@
+import os
+import queue
+import struct
+import threading
+import time
 import traceback
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
 import mysql.connector
 from cli_io import IO
+from tracing import Tracer
 
 
 class Resource:
     def use(self, data, log: IO) -> None:  # run critical code
         pass
 
+    def use_batch(self, items: List[Tuple[int, str]], log: IO) -> None:  # run critical code once for many (port, text) items
+        for data in items:
+            self.use(data=data, log=log)
+
     def finalize(self, log: IO) -> None:  # close any open buffers/connections
         pass
 
+
+class TracedResource(Resource):
+    """
+    records a span in "tracer" for every use()/use_batch() of "resource", on the track of the lock it runs under
+    """
+
+    def __init__(self, resource: Resource, tracer: Tracer, key='') -> None:
+        super().__init__()
+        self.resource = resource
+        self.tracer = tracer
+        self.track = f'lock {key!r}'
+
+    def use(self, data, log: IO) -> None:
+        with self.tracer.span('use', self.track, resource=type(self.resource).__name__, items=1):
+            self.resource.use(data=data, log=log)
+
+    def use_batch(self, items: List[Tuple[int, str]], log: IO) -> None:
+        with self.tracer.span('use', self.track, resource=type(self.resource).__name__, items=len(items)):
+            self.resource.use_batch(items=items, log=log)
+
+    def finalize(self, log: IO) -> None:
+        self.resource.finalize(log=log)
+
+class PooledConnection:
+    def __init__(self, connection) -> None:
+        self.connection = connection
+        self.last_used = time.monotonic()
+        self._prepared = None
+
+    def prepared(self):
+        """
+        a cursor for prepared statements, every statement is prepared once per connection and reused
+        """
+        if self._prepared is None:
+            self._prepared = self.connection.cursor(prepared=True)
+        return self._prepared
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception:
+            pass  # already broken
+
+
+class MySQLConnectionPool:
+    """
+    at most "size" connections, opened on demand and handed to one thread at a time.
+    a connection idle for more than "check_after" seconds is pinged before it is handed out
+    and replaced if it is dead, a connection that failed while in use is closed and replaced on the next checkout
+    """
+
+    def __init__(self, size=4, check_after=30.0, timeout: Optional[float] = None, **connect_args) -> None:
+        self.connect_args = connect_args
+        self.check_after = check_after
+        self.timeout = timeout  # seconds to wait for a free connection, None waits forever
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle: 'queue.LifoQueue[PooledConnection]' = queue.LifoQueue()  # the most recently used is the least likely to be dead
+
+    def open(self) -> PooledConnection:
+        return PooledConnection(mysql.connector.connect(**self.connect_args))
+
+    def get(self) -> PooledConnection:
+        if not self.slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"no free mysql connection after {self.timeout} seconds")
+        try:
+            try:
+                pooled = self.idle.get_nowait()
+            except queue.Empty:
+                return self.open()
+            if time.monotonic() - pooled.last_used > self.check_after and not pooled.connection.is_connected():
+                pooled.close()
+                return self.open()
+            return pooled
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def put(self, pooled: PooledConnection, broken=False):
+        if broken:
+            pooled.close()
+        else:
+            pooled.last_used = time.monotonic()
+            self.idle.put(pooled)
+        self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        pooled = self.get()
+        try:
+            yield pooled
+        except BaseException:
+            self.put(pooled, broken=True)
+            raise
+        self.put(pooled)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
 class MySQLResource(Resource):
-    def __init__(self, log: IO, host, database, user, password) -> None:
+    """
+    every entry is one insert and one atomic counter increment in a single transaction.
+    the statements are prepared once per pooled connection, a batch inserts all its rows with executemany
+    """
+    INSERT_HISTORY = "INSERT INTO usage_history (machine_port, data) VALUES (%s, %s)"
+    INCREMENT_COUNTER = "UPDATE counter SET counter = counter + %s"
+
+    def __init__(self, log: IO, host, database, user, password, pool_size=4) -> None:
         super().__init__()
         self.host = host
         self.database = database
-        self.connection = mysql.connector.connect(host=host, database=database, user=user, password=password)
-        if self.connection.is_connected():
-            log.write("[MySQLResource] Connected to MySQL, Server version: ", self.connection.get_server_info())
+        self.pool = MySQLConnectionPool(size=pool_size, host=host, database=database, user=user, password=password)
+        with self.pool.connection() as pooled:  # fail at startup if the database can't be reached
+            log.write(f"[MySQLResource] Connected to MySQL, Server version: {pooled.connection.get_server_info()}")
 
     def use(self, data, log: IO):
         port_col_value, text = data
         try:
-            log.write(f"[MySQLResource] using mysql database...")
-            cursor = self.connection.cursor()
-            cursor.execute("SELECT counter from counter")
-            result = cursor.fetchone()[0]
-            cursor.execute("INSERT INTO usage_history (machine_port, data) VALUES (%s, %s)", (str(port_col_value), text))
-            cursor.execute("UPDATE counter set counter=%s", (int(result + 1),))
-            self.connection.commit()
+            log.write("[MySQLResource] using mysql database...")
+            with self.pool.connection() as pooled:
+                cursor = pooled.prepared()
+                cursor.execute(self.INSERT_HISTORY, (str(port_col_value), text))
+                cursor.execute(self.INCREMENT_COUNTER, (1,))
+                pooled.connection.commit()
+        except KeyboardInterrupt as e:
+            raise e
+        except:
+            log.write(traceback.format_exc())
+
+    def use_batch(self, items: List[Tuple[int, str]], log: IO):
+        if len(items) == 1:
+            return self.use(data=items[0], log=log)
+        try:
+            log.write("[MySQLResource] using mysql database for %s rows...", len(items))
+            with self.pool.connection() as pooled:
+                # a plain cursor turns executemany of an INSERT into one multi-row statement,
+                # a prepared one would execute it once per row
+                cursor = pooled.connection.cursor()
+                try:
+                    cursor.executemany(self.INSERT_HISTORY, [(str(port), text) for port, text in items])
+                finally:
+                    cursor.close()
+                pooled.prepared().execute(self.INCREMENT_COUNTER, (len(items),))
+                pooled.connection.commit()
         except KeyboardInterrupt as e:
             raise e
         except:
             log.write(traceback.format_exc())
 
     def finalize(self, log: IO):
-        if self.connection.is_connected:
-            log.write("[MySQLResource] closing mysql connection")
-            self.connection.close()
+        log.write("[MySQLResource] closing mysql connections")
+        self.pool.close()
+
+# a record of FileResource: text length, port, then the utf-8 text
+RECORD_HEADER = struct.Struct('<II')
+
+FSYNC_NONE = 'none'  # leave it to the os
+FSYNC_ENTRY = 'entry'  # every use()/use_batch() is on disk before it returns
+FSYNC_PERIODIC = 'periodic'  # after "fsync_every" entries or "fsync_ms" milliseconds, whichever comes first
+
+
+def encode_record(port: int, text: str) -> bytes:
+    data = text.encode('utf-8')
+    return RECORD_HEADER.pack(len(data), port) + data
+
+
+def scan_records(path: str, chunk_size=1024 * 1024) -> Iterator[Tuple[int, str]]:
+    """
+    yield the (port, text) records of a FileResource file in order, reading it in large chunks.
+    a record cut short by a crash at the end of the file is ignored
+    """
+    with open(path, 'rb') as f:
+        pending = b''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buffer = pending + chunk if pending else chunk
+            offset = 0
+            while len(buffer) - offset >= RECORD_HEADER.size:
+                length, port = RECORD_HEADER.unpack_from(buffer, offset)
+                end = offset + RECORD_HEADER.size + length
+                if end > len(buffer):
+                    break
+                yield port, str(buffer[offset + RECORD_HEADER.size:end], 'utf-8')
+                offset = end
+            pending = buffer[offset:]
+
 
 class FileResource(Resource):
-    def __init__(self, log: IO, path: str) -> None:
+    """
+    appends length-prefixed records (see scan_records) through a handle that stays open until finalize().
+    the records of a call are written with a single write and flushed before it returns, since the next
+    holder of the lock may be another process appending to the same file. "fsync" is one of
+    FSYNC_NONE, FSYNC_ENTRY or FSYNC_PERIODIC. with FSYNC_PERIODIC a timer syncs the records that are
+    still unsynced "fsync_ms" after the first of them was written, also when no write follows
+    """
+
+    def __init__(self, log: IO, path: str, fsync=FSYNC_NONE, fsync_every=100, fsync_ms=1000.0,
+                 buffer_size=64 * 1024) -> None:
         super().__init__()
+        if fsync not in (FSYNC_NONE, FSYNC_ENTRY, FSYNC_PERIODIC):
+            raise ValueError(f"unknown fsync policy {fsync!r}")
         self.path = path
+        self.fsync = fsync
+        self.fsync_every = fsync_every
+        self.fsync_ms = fsync_ms
+        self.buffer_size = buffer_size
+        self.lock = threading.Lock()
+        self.file: Optional[BinaryIO] = None
+        self.unsynced = 0  # entries written since the last fsync
+        self.last_sync = time.monotonic()
+        self.sync_timer: Optional[threading.Timer] = None  # pending while there are unsynced entries
+        self.open()
+
+    def open(self) -> BinaryIO:
+        if self.file is None:
+            # append mode: every write lands at the current end, also after other processes appended
+            self.file = open(self.path, 'ab', buffering=self.buffer_size)
+        return self.file
+
+    def write(self, records: List[bytes], log: IO):
+        with self.lock:
+            try:
+                f = self.open()
+                f.write(b''.join(records))
+                f.flush()
+                self.unsynced += len(records)
+                if self.fsync == FSYNC_ENTRY or (self.fsync == FSYNC_PERIODIC and (
+                        self.unsynced >= self.fsync_every or (time.monotonic() - self.last_sync) * 1000 >= self.fsync_ms)):
+                    self.sync()
+                elif self.fsync == FSYNC_PERIODIC and self.sync_timer is None:
+                    self.sync_timer = threading.Timer(self.fsync_ms / 1000, self.sync_due, args=(log,))
+                    self.sync_timer.daemon = True
+                    self.sync_timer.start()
+            except KeyboardInterrupt as e:
+                raise e
+            except:
+                log.write(traceback.format_exc())
+                self.close()  # reopened by the next write
+
+    def sync(self):
+        self.cancel_sync_timer()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def sync_due(self, log: IO):
+        with self.lock:
+            if self.sync_timer is not threading.current_thread():
+                return  # cancelled by a sync that got the lock first
+            self.sync_timer = None
+            if self.file is None or not self.unsynced:
+                return
+            try:
+                self.sync()
+            except OSError:
+                log.write(traceback.format_exc())
+
+    def cancel_sync_timer(self):
+        if self.sync_timer is not None:
+            self.sync_timer.cancel()
+            self.sync_timer = None
 
     def use(self, data, log: IO):
         port, text = data
-        log.write(f"[FileResource] writing to file {self.path}, content: {port}: {text}")
+        log.write("[FileResource] writing to file %s, content: %s: %s", self.path, port, text)
+        self.write([encode_record(port, text)], log)
+
+    def use_batch(self, items: List[Tuple[int, str]], log: IO):
+        log.write("[FileResource] writing %s lines to file %s", len(items), self.path)
+        self.write([encode_record(port, text) for port, text in items], log)
+
+    def close(self):
+        self.cancel_sync_timer()
+        if self.file is None:
+            return
+        file, self.file = self.file, None
         try:
-            with open(self.path, 'a') as f:
-                f.write(f'{port}: {text}\n')
-        except KeyboardInterrupt as e:
-            raise e
-        except:
-            log.write(traceback.format_exc())
+            file.close()
+        except OSError:
+            pass
 
     def finalize(self, log: IO):
-        pass
\ No newline at end of file
+        with self.lock:
+            if self.file is not None and self.unsynced and self.fsync != FSYNC_NONE:
+                try:
+                    self.sync()
+                except OSError:
+                    log.write(traceback.format_exc())
+            self.close()
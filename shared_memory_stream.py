@@ -0,0 +1,345 @@
+import asyncio
+import mmap
+import os
+import struct
+import tempfile
+from typing import Awaitable, Callable, Optional, Union
+
+from BufferedSocketStream import AsyncBufferedSocketStream, ReceiveBuffer, start_unix_server
+
+SEGMENT_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+SEGMENT_PREFIX = 'dmutex-'
+SEGMENT_SUFFIX = '.ring'
+HANDSHAKE = struct.Struct('<4sH')  # magic, length of the segment path that follows
+HANDSHAKE_MAGIC = b'DMR1'
+DOORBELL = b'\x01'
+
+# the 8-byte fields at the start of a ring
+HEAD = 0  # bytes read so far, written by the consumer only
+TAIL = 1  # bytes written so far, written by the producer only
+CONSUMER_WAITING = 2  # set by the consumer before it sleeps, the producer rings after writing
+PRODUCER_WAITING = 3  # set by the producer when the ring is full, the consumer rings after reading
+
+
+class SharedMemoryRing:
+    """
+    single producer, single consumer byte ring in a mapping shared by two processes.
+    head and tail only grow, the offset in the data is position % capacity. each field is written by one side
+    only and through a memoryview cast to 8-byte integers, aligned stores the other side never sees torn
+    """
+
+    header_size = 64  # the fields, padded to a cache line
+
+    def __init__(self, view: memoryview, capacity: int):
+        self.fields = view[:self.header_size].cast('Q')
+        self.data = view[self.header_size:self.header_size + capacity]
+        self.capacity = capacity
+
+    @classmethod
+    def size(cls, capacity: int) -> int:
+        return cls.header_size + capacity
+
+    def readable(self) -> int:
+        return self.fields[TAIL] - self.fields[HEAD]
+
+    def write(self, data: memoryview) -> int:
+        """
+        copy as much of "data" as fits, return how many bytes were written
+        """
+        fields = self.fields
+        tail = fields[TAIL]
+        count = min(len(data), self.capacity - (tail - fields[HEAD]))
+        if count:
+            index = tail % self.capacity
+            first = min(count, self.capacity - index)
+            self.data[index:index + first] = data[:first]
+            if count > first:
+                self.data[:count - first] = data[first:count]
+            fields[TAIL] = tail + count  # published after the bytes
+        return count
+
+    def read_into(self, buffer: ReceiveBuffer, limit: int) -> int:
+        """
+        move up to "limit" readable bytes into "buffer", return how many were moved
+        """
+        fields = self.fields
+        head = fields[HEAD]
+        count = min(fields[TAIL] - head, limit)
+        if count <= 0:
+            return 0
+        target = buffer.writable(count)
+        index = head % self.capacity
+        first = min(count, self.capacity - index)
+        target[:first] = self.data[index:index + first]
+        if count > first:
+            target[first:count] = self.data[:count - first]
+        buffer.commit(count)
+        fields[HEAD] = head + count  # the space is given back after the copy
+        return count
+
+    def release(self):
+        self.fields.release()
+        self.data.release()
+
+
+def create_segment(capacity: int) -> tuple[str, mmap.mmap]:
+    fd, path = tempfile.mkstemp(prefix=SEGMENT_PREFIX, suffix=SEGMENT_SUFFIX, dir=SEGMENT_DIR)
+    try:
+        os.ftruncate(fd, 2 * SharedMemoryRing.size(capacity))
+        return path, mmap.mmap(fd, 2 * SharedMemoryRing.size(capacity))
+    except BaseException:
+        os.unlink(path)
+        raise
+    finally:
+        os.close(fd)
+
+
+def open_segment(path: str) -> mmap.mmap:
+    """
+    map a segment created by the peer. only our own segment files are accepted, the path comes from the socket
+    """
+    name = os.path.basename(path)
+    if (os.path.dirname(os.path.abspath(path)) != os.path.abspath(SEGMENT_DIR)
+            or not name.startswith(SEGMENT_PREFIX) or not name.endswith(SEGMENT_SUFFIX)):
+        raise ConnectionError(f"refusing to map {path!r}, not a ring segment")
+    fd = os.open(path, os.O_RDWR)
+    try:
+        size = os.fstat(fd).st_size
+        if size <= 2 * SharedMemoryRing.header_size or size % 2:
+            raise ConnectionError(f"ring segment {path!r} has a bad size {size}")
+        return mmap.mmap(fd, size)
+    finally:
+        os.close(fd)
+
+
+class AsyncSharedMemoryStream(AsyncBufferedSocketStream):
+    """
+    AsyncBufferedSocketStream whose bytes go through two SharedMemoryRing (one per direction) in a mapping
+    created by the connecting side, for peers on the same host. the unix socket the mapping was announced on
+    only carries one-byte wakeups: to a reader that waits for data, to a writer that waits for space, nothing
+    while the other side is busy. a wakeup can still be missed (the flag and the position are written without
+    a fence) so a waiting side also polls its ring, every 1 ms at first then less and less often.
+    the connection ends when the socket does
+    """
+
+    capacity = 256 * 1024  # bytes per direction
+    poll_min = 0.001
+    poll_max = 0.1
+
+    def __init__(self, on_connected: Optional[Callable[['AsyncBufferedSocketStream'], Awaitable[None]]] = None):
+        super().__init__(on_connected)
+        self.mapping: Optional[mmap.mmap] = None
+        self.segment_path: Optional[str] = None
+        self.tx: Optional[SharedMemoryRing] = None
+        self.rx: Optional[SharedMemoryRing] = None
+        self._received = bytearray(4096)  # what the socket brings: the handshake, then wakeups
+        self._handshake = bytearray()
+        self._overflow = bytearray()  # written while the ring was full, flushed as the peer reads
+        self._poll_handle: Optional[asyncio.TimerHandle] = None
+
+    @classmethod
+    async def connect(cls, address: Union[tuple[str, int], int, str]) -> 'AsyncSharedMemoryStream':
+        """
+        "address" is the path of the unix socket the peer accepts ring connections on
+        """
+        if not isinstance(address, str):
+            raise ValueError(f"a shared memory ring needs a unix socket path, got {address!r}")
+        stream = cls()
+        stream.segment_path, stream.mapping = create_segment(cls.capacity)
+        stream._attach(first=True)
+        try:
+            await asyncio.get_running_loop().create_unix_connection(lambda: stream, address)
+        except BaseException:
+            stream._release()
+            raise
+        stream.address = address
+        path = stream.segment_path.encode('utf-8')
+        stream.transport.write(HANDSHAKE.pack(HANDSHAKE_MAGIC, len(path)) + path)
+        return stream
+
+    def _attach(self, first: bool):
+        view = memoryview(self.mapping)
+        capacity = len(view) // 2 - SharedMemoryRing.header_size
+        rings = (SharedMemoryRing(view, capacity), SharedMemoryRing(view[len(view) // 2:], capacity))
+        view.release()
+        self.tx, self.rx = rings if first else reversed(rings)
+
+    def _release(self):
+        for ring in (self.tx, self.rx):
+            if ring is not None:
+                ring.release()
+        self.tx = self.rx = None
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+        if self.segment_path is not None:
+            try:
+                os.unlink(self.segment_path)
+            except FileNotFoundError:
+                pass  # the peer removes it once mapped
+            self.segment_path = None
+
+    # protocol callbacks, called by the event loop
+
+    def connection_made(self, transport):
+        if self.rx is not None:
+            super().connection_made(transport)
+        else:
+            self.transport = transport  # accepted, on_connected runs once the handshake is read
+
+    def get_buffer(self, sizehint):
+        return self._received
+
+    def buffer_updated(self, nbytes):
+        if self.rx is None:
+            self._read_handshake(nbytes)
+        else:
+            self._pump()
+
+    def _read_handshake(self, nbytes):
+        self._handshake += self._received[:nbytes]
+        if len(self._handshake) < HANDSHAKE.size:
+            return
+        magic, length = HANDSHAKE.unpack_from(self._handshake)
+        if magic != HANDSHAKE_MAGIC:
+            self._closed_exc = ConnectionError(f"not a ring connection, got {bytes(magic)!r}")
+            self.transport.close()
+            return
+        if len(self._handshake) < HANDSHAKE.size + length:
+            return
+        path = self._handshake[HANDSHAKE.size:HANDSHAKE.size + length].decode('utf-8')
+        try:
+            self.mapping = open_segment(path)
+            os.unlink(path)  # both sides have it mapped, nothing is left behind if either dies
+        except (OSError, ConnectionError, ValueError) as e:
+            self._closed_exc = ConnectionError(f"can't map the ring segment: {e}")
+            self.transport.close()
+            return
+        self._attach(first=False)
+        self._handshake = bytearray()
+        super().connection_made(self.transport)
+        self._pump()  # the peer may have written before we mapped
+
+    def _take(self) -> int:
+        """
+        move what the peer wrote into the receive buffer, up to high_water unread bytes
+        """
+        taken = self.rx.read_into(self.buffer, self.high_water - len(self.buffer))
+        if taken:
+            self._ring(self.rx, PRODUCER_WAITING)
+        return taken
+
+    def _pump(self):
+        """
+        called on every wakeup and poll: take what the peer wrote, push what we could not write yet
+        """
+        if self.rx is None:
+            return
+        if self._take() and self._read_waiter is not None and len(self.buffer) >= self._needed:
+            self._wake(self._read_waiter)
+            self._read_waiter = None
+        if self._overflow:
+            self._flush_overflow()
+
+    def _ring(self, ring: SharedMemoryRing, flag: int):
+        """
+        wake the peer if it waits on "ring". the flag is cleared so a burst of writes rings once,
+        the peer sets it again before its next wait
+        """
+        if ring.fields[flag]:
+            ring.fields[flag] = 0
+            if not self.transport.is_closing():
+                self.transport.write(DOORBELL)
+
+    def connection_lost(self, exc):
+        if self.rx is not None:
+            self._take()  # what the peer wrote before closing can still be read
+        super().connection_lost(exc)
+        self._release()
+
+    def pause_writing(self):
+        pass  # only wakeups go through the socket, the peer always reads them
+
+    def resume_writing(self):
+        pass
+
+    async def _wait(self, waiter: asyncio.Future):
+        if self._poll_handle is None:
+            self._poll_handle = asyncio.get_running_loop().call_later(self.poll_min, self._poll, self.poll_min)
+        await waiter
+
+    def _poll(self, delay: float):
+        """
+        one timer per stream, left running across waits instead of being set and cancelled for each one
+        """
+        self._poll_handle = None
+        if self.rx is None:
+            return
+        self._pump()
+        if self._read_waiter is not None or self._drain_waiter is not None:
+            delay = min(delay * 2, self.poll_max)
+            self._poll_handle = asyncio.get_running_loop().call_later(delay, self._poll, delay)
+
+    # stream api
+
+    async def read(self, count) -> memoryview:
+        while len(self.buffer) < count:
+            if self._closed_exc is not None:
+                raise ConnectionError(f"received {len(self.buffer)} of {count} bytes possibly socket disconnected") from self._closed_exc
+            if self._take():
+                continue
+            self._needed = count
+            self._read_waiter = waiter = asyncio.get_running_loop().create_future()
+            self.rx.fields[CONSUMER_WAITING] = 1
+            self._pump()  # a write that came before the flag did not ring
+            try:
+                await self._wait(waiter)
+            finally:
+                if self.rx is not None:
+                    self.rx.fields[CONSUMER_WAITING] = 0
+        self._needed = 0
+        return self.buffer.consume(count)
+
+    def sendall(self, bytes: bytes):
+        if self._closed_exc is not None:
+            raise self._closed_exc
+        if self._overflow:
+            self._overflow += bytes  # keep the order behind what is already waiting
+            self._flush_overflow()
+            return
+        data = memoryview(bytes)
+        written = self.tx.write(data)
+        if written < len(data):
+            self._overflow += data[written:]
+            self.tx.fields[PRODUCER_WAITING] = 1
+        if written:
+            self._ring(self.tx, CONSUMER_WAITING)
+
+    def _flush_overflow(self):
+        written = self.tx.write(memoryview(self._overflow))
+        if written:
+            del self._overflow[:written]
+            self._ring(self.tx, CONSUMER_WAITING)
+        if self._overflow:
+            self.tx.fields[PRODUCER_WAITING] = 1
+        else:
+            self.tx.fields[PRODUCER_WAITING] = 0
+            self._wake(self._drain_waiter)
+            self._drain_waiter = None
+
+    async def drain(self):
+        while self._overflow:
+            if self._closed_exc is not None:
+                raise self._closed_exc
+            self._drain_waiter = waiter = asyncio.get_running_loop().create_future()
+            await self._wait(waiter)
+        if self._closed_exc is not None:
+            raise self._closed_exc
+
+
+async def start_ring_server(on_connected: Callable[[AsyncBufferedSocketStream], Awaitable[None]], path: str,
+                            backlog=100) -> asyncio.AbstractServer:
+    """
+    accept AsyncSharedMemoryStream connections on the unix socket "path"
+    """
+    return await start_unix_server(on_connected, path, backlog=backlog, stream_class=AsyncSharedMemoryStream)
@@ -0,0 +1,250 @@
+import heapq
+import math
+import random
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple, Type
+
+from algorithms import MutexAlgorithm, get_algorithm
+from cli_io import SilentIO
+from frame import Frame
+
+
+class SimulatedNetwork:
+    """
+    a virtual clock and an event queue standing in for the sockets and the event loop.
+    every message gets a seeded random delay between min_delay and max_delay, messages between two nodes
+    keep their order like on a TCP connection unless "reorder" is set. drop_rate loses messages at random,
+    a partition holds back the messages between its groups until it heals.
+    the same seed gives the same run
+    """
+
+    def __init__(self, seed=0, min_delay=0.0005, max_delay=0.002, drop_rate=0.0, reorder=False):
+        self.rng = random.Random(seed)
+        self.random = self.rng.random
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.drop_rate = drop_rate
+        self.reorder = reorder
+        self.now = 0.0
+        self.events: List[tuple] = []  # heap of (time, sequence, callback, args)
+        self.sequence = 0
+        self.handlers: Dict[int, Callable[[int, Frame], None]] = {}
+        self.last_delivery: Dict[Tuple[int, int], float] = {}  # per link, keeps the order without "reorder"
+        self.partitions: List[Tuple[float, float, Dict[int, int]]] = []  # (start, end, group of every node)
+        self.sent = 0
+        self.dropped = 0
+
+    def attach(self, node: int, handler: Callable[[int, Frame], None]):
+        self.handlers[node] = handler
+
+    def schedule(self, delay: float, callback: Callable, *args):
+        self.schedule_at(self.now + delay, callback, *args)
+
+    def schedule_at(self, at: float, callback: Callable, *args):
+        self.sequence += 1
+        heapq.heappush(self.events, (at, self.sequence, callback, args))
+
+    def partition(self, groups: Sequence[Set[int]], start: float, end: float):
+        """
+        from "start" to "end" (virtual seconds) messages between different groups are held back until "end"
+        """
+        group_of = {node: i for i, group in enumerate(groups) for node in group}
+        self.partitions.append((start, end, group_of))
+
+    def delay(self) -> float:
+        return self.min_delay + (self.max_delay - self.min_delay) * self.random()
+
+    def send(self, src: int, dst: int, frame: Frame):
+        # the hot path of a simulation, one call per message
+        self.sent += 1
+        if self.drop_rate and self.random() < self.drop_rate:
+            self.dropped += 1
+            return
+        at = self.now + self.delay()
+        for start, end, group_of in self.partitions:
+            if start <= self.now < end and group_of.get(src) != group_of.get(dst):
+                at = max(at, end + self.delay())
+        if not self.reorder:
+            link = (src, dst)
+            last = self.last_delivery.get(link, 0.0)
+            if last > at:
+                at = last
+            self.last_delivery[link] = at
+        self.sequence += 1
+        heapq.heappush(self.events, (at, self.sequence, self.handlers[dst], (src, frame)))
+
+    def run(self, until=math.inf):
+        events = self.events
+        while events:
+            if events[0][0] > until:
+                return
+            at, _, callback, args = heapq.heappop(events)
+            self.now = at
+            callback(*args)
+
+
+class Fenwick:
+    """
+    counts of entered requests by request order, to count in O(log n) how many later requests went first
+    """
+
+    def __init__(self, size: int):
+        self.tree = [0] * (size + 1)
+
+    def add(self, index: int):
+        index += 1
+        while index < len(self.tree):
+            self.tree[index] += 1
+            index += index & -index
+
+    def count_up_to(self, index: int) -> int:
+        index += 1
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+
+class SimulatedNode:
+    """
+    drives one MutexAlgorithm: think, request, hold, release, "entries" times
+    """
+
+    def __init__(self, simulation: 'Simulation', node_id: int, peers: List[int], algorithm: Type[MutexAlgorithm]):
+        self.simulation = simulation
+        self.network = simulation.network
+        self.node_id = node_id
+        self.algorithm = algorithm(node_id, peers, send=self.send, entered=self.entered, log=simulation.log)
+        self.network.attach(node_id, self.algorithm.on_message)
+        self.remaining = simulation.entries
+        self.entries = 0
+        self.shared = False
+        self.requested_at = 0.0
+        self.request_index = 0
+
+    def send(self, dst: int, frame: Frame):
+        self.network.send(self.node_id, dst, frame)
+
+    def start(self):
+        self.network.schedule(self.simulation.think_time(), self.request)
+
+    def request(self):
+        self.shared = self.simulation.rng.random() < self.simulation.read_ratio
+        self.requested_at = self.network.now
+        self.request_index = self.simulation.next_request_index()
+        self.simulation.waiting += 1
+        self.algorithm.request(self.shared)
+
+    def entered(self):
+        self.simulation.on_enter(self)
+        self.network.schedule(self.simulation.hold_time(), self.release)
+
+    def release(self):
+        self.simulation.on_release(self)
+        self.algorithm.release()
+        self.entries += 1
+        self.remaining -= 1
+        if self.remaining > 0:
+            self.network.schedule(self.simulation.think_time(), self.request)
+
+
+class Simulation:
+    """
+    "nodes" virtual nodes running "algorithm" over a SimulatedNetwork, each enters "entries" times with
+    exponential think times ("think" seconds on average) and holds the critical section "hold" seconds
+    (exponential too). read_ratio of the requests are shared (ricart_agrawala only).
+    every entry is checked: a writer is never inside with anyone else. fairness is measured as the
+    number of requests made after a request that still entered before it ("bypasses")
+    """
+
+    def __init__(self, algorithm='ricart_agrawala', nodes=10, entries=10, seed=0, think=0.01, hold=0.001,
+                 read_ratio=0.0, min_delay=0.0005, max_delay=0.002, drop_rate=0.0, reorder=False):
+        algorithm_class = get_algorithm(algorithm)
+        if read_ratio and not algorithm_class.supports_shared:
+            raise ValueError(f"{algorithm} has no shared (read) mode")
+        self.algorithm = algorithm
+        self.entries = entries
+        self.think = think
+        self.hold = hold
+        self.read_ratio = read_ratio
+        self.rng = random.Random(seed)
+        self.log = SilentIO()
+        self.network = SimulatedNetwork(seed=seed, min_delay=min_delay, max_delay=max_delay, drop_rate=drop_rate,
+                                        reorder=reorder)
+        ids = list(range(1, nodes + 1))
+        self.nodes = [SimulatedNode(self, i, [p for p in ids if p != i], algorithm_class) for i in ids]
+        self.readers = 0
+        self.writers = 0
+        self.waiting = 0
+        self.violations = 0
+        self.first_violation: Optional[float] = None
+        self.latencies: List[float] = []
+        self.bypasses: List[int] = []
+        self.requests = 0
+        self.entered = Fenwick(nodes * entries)
+
+    def think_time(self) -> float:
+        return self.rng.expovariate(1 / self.think) if self.think > 0 else 0.0
+
+    def hold_time(self) -> float:
+        return self.rng.expovariate(1 / self.hold) if self.hold > 0 else 0.0
+
+    def next_request_index(self) -> int:
+        self.requests += 1
+        return self.requests - 1
+
+    def on_enter(self, node: SimulatedNode):
+        if self.writers or (not node.shared and self.readers):
+            self.violations += 1
+            if self.first_violation is None:
+                self.first_violation = self.network.now
+        if node.shared:
+            self.readers += 1
+        else:
+            self.writers += 1
+        self.waiting -= 1
+        self.latencies.append(self.network.now - node.requested_at)
+        # the requests made after this one that already entered
+        self.bypasses.append(len(self.latencies) - 1 - self.entered.count_up_to(node.request_index))
+        self.entered.add(node.request_index)
+
+    def on_release(self, node: SimulatedNode):
+        if node.shared:
+            self.readers -= 1
+        else:
+            self.writers -= 1
+
+    def run(self, until=math.inf) -> dict:
+        started = time.perf_counter()
+        for node in self.nodes:
+            node.start()
+        self.network.run(until)
+        wall = time.perf_counter() - started
+        entries = len(self.latencies)
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+        per_node = [node.entries for node in self.nodes]
+        return {
+            'algorithm': self.algorithm,
+            'nodes': len(self.nodes),
+            'entries': entries,
+            'expected_entries': len(self.nodes) * self.entries,
+            'stuck_requests': self.waiting,
+            'messages': self.network.sent,
+            'dropped': self.network.dropped,
+            'messages_per_entry': self.network.sent / entries if entries else 0.0,
+            'virtual_seconds': self.network.now,
+            'wall_seconds': wall,
+            'p50_ms': percentile(0.5) * 1000,
+            'p99_ms': percentile(0.99) * 1000,
+            'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+            'violations': self.violations,
+            'first_violation': self.first_violation,
+            'max_bypass': max(self.bypasses, default=0),
+            'min_node_entries': min(per_node),
+            'max_node_entries': max(per_node),
+        }
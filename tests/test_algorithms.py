@@ -0,0 +1,119 @@
+"""
+single algorithm instances wired together by hand, messages are delivered only when the test says so
+"""
+from collections import deque
+from functools import partial
+from typing import Deque, Dict, List, Set, Tuple, Type
+
+from algorithms import (MESSAGE_TYPE_PERMISSION_GRANTED, MESSAGE_TYPE_PERMISSION_REQUEST, MutexAlgorithm, RicartAgrawala,
+                        RoucairolCarvalho, SuzukiKasami)
+from cli_io import SilentIO
+from frame import Frame
+
+
+class Cluster:
+    def __init__(self, algorithm: Type[MutexAlgorithm], ids: List[int]):
+        self.in_flight: Deque[Tuple[int, int, Frame]] = deque()  # (sender, receiver, frame)
+        self.entries: Set[int] = set()
+        self.nodes: Dict[int, MutexAlgorithm] = {
+            i: algorithm(i, [p for p in ids if p != i], send=partial(self.send, i), entered=partial(self.entries.add, i),
+                         log=SilentIO())
+            for i in ids}
+
+    def send(self, sender: int, receiver: int, frame: Frame):
+        self.in_flight.append((sender, receiver, frame))
+
+    def deliver(self):
+        while self.in_flight:
+            sender, receiver, frame = self.in_flight.popleft()
+            self.nodes[receiver].on_message(sender, frame)
+
+    def deliver_one(self, sender: int, receiver: int, message_type: int):
+        """
+        deliver the oldest such message ahead of the others
+        """
+        for message in self.in_flight:
+            if message[:2] == (sender, receiver) and message[2].type == message_type:
+                self.in_flight.remove(message)
+                self.nodes[receiver].on_message(sender, message[2])
+                return
+        raise AssertionError(f"no message of type {message_type} from {sender} to {receiver} in flight")
+
+
+def test_suzuki_kasami_serves_a_request_made_after_a_withdrawn_one():
+    cluster = Cluster(SuzukiKasami, [1, 2, 3])
+    holder, node = cluster.nodes[1], cluster.nodes[2]
+    holder.request()  # holds the token, enters right away
+    assert holder.in_cs
+    node.request()
+    cluster.deliver()
+    node.release()  # the acquire timed out
+    node.request()
+    cluster.deliver()
+    assert holder.rn[2] == 2 and holder.ln[2] == 0
+    holder.release()
+    cluster.deliver()
+    assert node.in_cs and node.has_token
+    assert not holder.has_token
+
+
+def test_suzuki_kasami_passes_on_a_token_that_reaches_a_withdrawn_request():
+    cluster = Cluster(SuzukiKasami, [1, 2, 3])
+    holder = cluster.nodes[1]
+    holder.request()
+    cluster.nodes[2].request()
+    cluster.nodes[3].request()
+    cluster.deliver()
+    cluster.nodes[2].release()  # withdrawn, 3 still waits
+    holder.release()
+    cluster.deliver()
+    assert cluster.entries == {1, 3}
+    assert cluster.nodes[3].in_cs and cluster.nodes[3].has_token
+
+
+def test_suzuki_kasami_ignores_requests_from_non_members():
+    cluster = Cluster(SuzukiKasami, [1, 2])
+    holder = cluster.nodes[1]
+    holder.request()
+    holder.on_message(9, Frame(MESSAGE_TYPE_PERMISSION_REQUEST, 9, 1, b''))
+    assert 9 not in holder.rn
+    cluster.nodes[2].request()
+    cluster.deliver()
+    holder.release()  # used to raise KeyError looking up the stranger in LN
+    cluster.deliver()
+    assert cluster.nodes[2].in_cs and cluster.nodes[2].has_token
+
+
+def test_ricart_agrawala_grants_a_peer_that_was_suspected_for_a_while():
+    cluster = Cluster(RicartAgrawala, [1, 2])
+    holder, node = cluster.nodes[1], cluster.nodes[2]
+    holder.request()
+    cluster.deliver()
+    assert holder.in_cs
+    node.request()
+    cluster.deliver()  # deferred by the holder
+    holder.on_peer_down(2)
+    holder.on_peer_up(2)
+    holder.release()
+    cluster.deliver()
+    assert node.in_cs
+    assert node.missing() == []
+
+
+def test_roucairol_carvalho_drops_a_grant_overtaken_by_a_later_request():
+    cluster = Cluster(RoucairolCarvalho, [1, 2])
+    first, second = cluster.nodes[1], cluster.nodes[2]
+    first.request()
+    cluster.deliver_one(1, 2, MESSAGE_TYPE_PERMISSION_REQUEST)  # 2 grants, the grant is slow
+    first.release()  # the acquire timed out
+    second.request()
+    cluster.deliver_one(2, 1, MESSAGE_TYPE_PERMISSION_REQUEST)  # overtakes the grant, 1 grants too
+    cluster.deliver_one(2, 1, MESSAGE_TYPE_PERMISSION_GRANTED)  # stale, 1 gave the permission away since
+    cluster.deliver()
+    assert second.in_cs
+    first.request()
+    cluster.deliver()
+    assert not first.in_cs
+    second.release()
+    cluster.deliver()
+    assert first.in_cs
@@ -0,0 +1,24 @@
+import membership
+from cli_io import SilentIO
+from membership import decode_members, encode_members, is_local, parse_address
+from node import Node
+
+
+def test_members_round_trip():
+    members = {1: ('10.0.0.1', 7000), 2: ('::1', 7001), 3: ('db-3.example', 7002)}
+    assert decode_members(encode_members(members)) == members
+    assert parse_address('[::1]:7001') == ('::1', 7001)
+    assert parse_address('7000') == ('127.0.0.1', 7000)
+
+
+def test_host_names_are_looked_up_once_per_node(monkeypatch):
+    lookups = []
+    monkeypatch.setattr(membership.sockets, 'gethostname', lambda: 'box')
+    monkeypatch.setattr(membership.sockets, 'getfqdn', lambda: lookups.append(1) or 'box.example')
+    node = Node(0, [1], log=SilentIO(), transport='unix')
+    assert lookups == [1]
+    assert is_local(('box.example', 1), node.local_names)
+    assert is_local(('127.0.1.1', 1), node.local_names)
+    assert not is_local(('10.0.0.1', 1), node.local_names)
+    assert not is_local(('box', 1))  # without the names only the loopback addresses are local
+    assert lookups == [1]
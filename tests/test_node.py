@@ -0,0 +1,74 @@
+"""
+Node logic that needs no event loop or sockets
+"""
+import asyncio
+
+import pytest
+
+from algorithms import (MESSAGE_TYPE_PERMISSION_GRANTED, MESSAGE_TYPE_PERMISSION_REQUEST, MESSAGE_TYPE_RELEASE,
+                        RoucairolCarvalho)
+from cli_io import SilentIO
+from frame import Frame
+from node import Node
+
+
+def holding_node(algorithm: str) -> Node:
+    node = Node(0, [1, 2, 3, 4, 5, 6, 7, 8], log=SilentIO(), algorithm=algorithm)
+    node.lock('').in_cs = True
+    return node
+
+
+@pytest.mark.parametrize('algorithm', ['ricart_agrawala', 'roucairol_carvalho', 'suzuki_kasami'])
+def test_hand_over_without_limit_while_nobody_waits(algorithm):
+    node = holding_node(algorithm)
+    assert node.keep_for_local_waiter('', handoffs=100, budget=2)
+
+
+def test_hand_over_budget_when_remote_waiters_are_not_visible():
+    node = holding_node('maekawa')
+    assert node.keep_for_local_waiter('', handoffs=1, budget=2)
+    assert not node.keep_for_local_waiter('', handoffs=2, budget=2)
+    assert not node.keep_for_local_waiter('', handoffs=0, budget=0)
+
+
+def captured_node(algorithm: str, sent: list) -> Node:
+    node = Node(0, [1, 2], log=SilentIO(), algorithm=algorithm)
+    node.send = lambda port, frame: sent.append((port, frame))
+    return node
+
+
+@pytest.mark.parametrize('algorithm', ['ricart_agrawala', 'roucairol_carvalho', 'maekawa'])
+def test_keys_named_by_other_nodes_are_dropped_once_idle(algorithm):
+    sent = []
+    node = captured_node(algorithm, sent)
+    payload = RoucairolCarvalho.GRANTS.pack(0) if algorithm == 'roucairol_carvalho' else b''
+    asyncio.run(node.handle_node_message(1, Frame(MESSAGE_TYPE_PERMISSION_REQUEST, 1, 7, payload, key='x')))
+    assert [(port, frame.type) for port, frame in sent] == [(1, MESSAGE_TYPE_PERMISSION_GRANTED)]
+    if algorithm == 'maekawa':
+        assert 'x' in node.locks  # locked for node 1 until it releases
+        asyncio.run(node.handle_node_message(1, Frame(MESSAGE_TYPE_RELEASE, 1, 7, key='x')))
+    assert 'x' not in node.locks
+    assert node.lock('x').h >= 7  # the clock goes on where the dropped instance was
+
+
+def test_token_holder_state_is_never_dropped():
+    node = captured_node('suzuki_kasami', [])
+    asyncio.run(node.handle_node_message(1, Frame(MESSAGE_TYPE_PERMISSION_REQUEST, 1, 1, key='x')))
+    asyncio.run(node.handle_node_message(1, Frame(MESSAGE_TYPE_PERMISSION_REQUEST, 1, 1, key='y')))
+    assert set(node.locks) == {'x', 'y'}
+
+
+def test_grants_to_a_dropped_instance_stay_stale():
+    sent = []
+    node = captured_node('roucairol_carvalho', sent)
+    asyncio.run(node.handle_node_message(1, Frame(MESSAGE_TYPE_PERMISSION_REQUEST, 1, 1, RoucairolCarvalho.GRANTS.pack(0),
+                                                  key='x')))
+    assert 'x' not in node.locks and node.dropped_grants == 1
+    algorithm = node.lock('x')
+    algorithm.request()
+    algorithm.on_message(2, Frame(MESSAGE_TYPE_PERMISSION_GRANTED, 2, algorithm.h, RoucairolCarvalho.GRANTS.pack(1), key='x'))
+    # node 1 answered a request of the dropped instance before we gave it our permission
+    algorithm.on_message(1, Frame(MESSAGE_TYPE_PERMISSION_GRANTED, 1, algorithm.h, RoucairolCarvalho.GRANTS.pack(0), key='x'))
+    assert not algorithm.in_cs
+    algorithm.on_message(1, Frame(MESSAGE_TYPE_PERMISSION_GRANTED, 1, algorithm.h, RoucairolCarvalho.GRANTS.pack(1), key='x'))
+    assert algorithm.in_cs
@@ -0,0 +1,43 @@
+import threading
+import time
+
+from distributed_mutex import DistributedMutex
+
+
+def test_frames_wait_for_a_peer_that_starts_late():
+    first = DistributedMutex(26611, [26612], request_timeout=6)
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(first.acquire()))
+    waiter.start()
+    time.sleep(1.5)  # longer than the connect attempts of one round
+    second = DistributedMutex(26612, [26611], request_timeout=6)
+    try:
+        waiter.join(timeout=10)
+        assert acquired == [True]
+        first.release()
+        assert second.acquire(timeout=5)
+        second.release()
+    finally:
+        second.close()
+        first.close()
+
+
+def test_forget_drops_the_frames_of_a_peer_that_left():
+    mutex = DistributedMutex(26613, [26614], request_timeout=0.5)
+    try:
+        assert not mutex.acquire()  # the request waits for 26614
+        assert mutex._call(_pending(mutex, 26614))
+        mutex._call(_remove(mutex, 26614))
+        assert not mutex._call(_pending(mutex, 26614))
+        assert mutex.acquire(timeout=1)  # nobody else is left
+        mutex.release()
+    finally:
+        mutex.close()
+
+
+async def _pending(mutex: DistributedMutex, peer: int):
+    return mutex.node.peers.pending.get(peer)
+
+
+async def _remove(mutex: DistributedMutex, peer: int):
+    mutex.node.remove_peer(peer)
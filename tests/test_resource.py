@@ -0,0 +1,37 @@
+import os
+import time
+
+import resource_type
+from cli_io import SilentIO
+from resource_type import FSYNC_PERIODIC, FileResource, scan_records
+
+
+def test_periodic_fsync_without_a_following_write(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(resource_type.os, 'fsync', lambda fd: synced.append(time.monotonic()))
+    path = str(tmp_path / 'db.bin')
+    resource = FileResource(SilentIO(), path, fsync=FSYNC_PERIODIC, fsync_every=1000, fsync_ms=50)
+    written = time.monotonic()
+    resource.use_batch([(1, 'a'), (1, 'b')], SilentIO())
+    deadline = time.monotonic() + 2
+    while not synced and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(synced) == 1 and synced[0] - written >= 0.05
+    assert resource.unsynced == 0 and resource.sync_timer is None
+    resource.finalize(SilentIO())
+    assert len(synced) == 1
+    assert list(scan_records(path)) == [(1, 'a'), (1, 'b')]
+
+
+def test_periodic_fsync_by_count_cancels_the_timer(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(resource_type.os, 'fsync', lambda fd: synced.append(fd))
+    resource = FileResource(SilentIO(), str(tmp_path / 'db.bin'), fsync=FSYNC_PERIODIC, fsync_every=2, fsync_ms=50)
+    resource.use((1, 'a'), SilentIO())
+    assert resource.sync_timer is not None
+    resource.use((1, 'b'), SilentIO())
+    assert len(synced) == 1 and resource.sync_timer is None
+    time.sleep(0.1)
+    assert len(synced) == 1
+    resource.finalize(SilentIO())
+    assert os.path.getsize(tmp_path / 'db.bin') > 0
@@ -0,0 +1,38 @@
+"""
+the algorithms on the deterministic simulated network, over FIFO links like the real (TCP, unix, shm) ones
+"""
+import pytest
+
+from algorithms import ALGORITHMS
+from simulator import Simulation
+
+
+@pytest.mark.parametrize('algorithm', list(ALGORITHMS))
+@pytest.mark.parametrize('nodes', [2, 5, 12])
+@pytest.mark.parametrize('seed', range(3))
+def test_safe_and_live(algorithm, nodes, seed):
+    result = Simulation(algorithm, nodes=nodes, entries=20, seed=seed).run()
+    assert result['violations'] == 0
+    assert result['stuck_requests'] == 0
+    assert result['entries'] == result['expected_entries']
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_safe_and_live_with_readers(seed):
+    result = Simulation('ricart_agrawala', nodes=8, entries=20, seed=seed, read_ratio=0.7).run()
+    assert result['violations'] == 0
+    assert result['stuck_requests'] == 0
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_roucairol_carvalho_safe_when_links_reorder(seed):
+    result = Simulation('roucairol_carvalho', nodes=30, entries=30, seed=seed, reorder=True).run()
+    assert result['violations'] == 0
+    assert result['stuck_requests'] == 0
+
+
+def test_same_seed_same_run():
+    first = Simulation('maekawa', nodes=9, entries=10, seed=7).run()
+    second = Simulation('maekawa', nodes=9, entries=10, seed=7).run()
+    for field in ('entries', 'messages', 'virtual_seconds', 'p99_ms', 'max_bypass'):
+        assert first[field] == second[field]
@@ -0,0 +1,96 @@
+"""
+span tracing of a node, dumped as trace-event JSON for chrome://tracing or https://ui.perfetto.dev
+
+merge the dumps of several nodes into one cluster timeline:
+
+    python tracing.py out=cluster.json trace-1.json trace-2.json trace-3.json
+"""
+import json
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+class Tracer:
+    """
+    keeps the last "capacity" spans (name, track, start, end, tags) of a node in a ring, older ones are dropped.
+    a dump has one process per node (pid = node id) and one thread per track ("lock <key>", "peer <id>",
+    "messages", ...). times are wall clock nanoseconds so the dumps of several hosts line up in a merged
+    trace, as well as the clocks of the hosts agree.
+    record() and span() may be called from any thread
+    """
+
+    def __init__(self, node_id: int, capacity=65536):
+        self.node_id = node_id
+        self.spans: Deque[Tuple[str, str, int, int, dict]] = deque(maxlen=capacity)
+
+    now = staticmethod(time.time_ns)
+
+    def record(self, name: str, track: str, start: int, end: Optional[int] = None, **tags):
+        self.spans.append((name, track, start, time.time_ns() if end is None else end, tags))
+
+    @contextmanager
+    def span(self, name: str, track: str, **tags) -> Iterator[dict]:
+        """
+        record the time spent in the block, tags added to the yielded dict are recorded too
+        """
+        start = time.time_ns()
+        try:
+            yield tags
+        finally:
+            self.spans.append((name, track, start, time.time_ns(), tags))
+
+    def events(self) -> List[dict]:
+        spans = list(self.spans)  # copied at once, the ring keeps filling meanwhile
+        events = [{'ph': 'M', 'name': 'process_name', 'pid': self.node_id, 'tid': 0,
+                   'args': {'name': f'node {self.node_id}'}}]
+        tracks: Dict[str, int] = {}
+        for name, track, start, end, tags in spans:
+            tid = tracks.get(track)
+            if tid is None:
+                tid = tracks[track] = len(tracks) + 1
+                events.append({'ph': 'M', 'name': 'thread_name', 'pid': self.node_id, 'tid': tid,
+                               'args': {'name': track}})
+            events.append({'ph': 'X', 'name': name, 'cat': track.split(' ', 1)[0], 'pid': self.node_id, 'tid': tid,
+                           'ts': start / 1000, 'dur': (end - start) / 1000, 'args': tags})
+        return events
+
+    def dump(self, path: str) -> int:
+        """
+        write the spans to "path" as trace-event JSON, return how many there were
+        """
+        events = self.events()
+        write_trace(path, events)
+        return sum(1 for event in events if event['ph'] == 'X')
+
+
+def write_trace(path: str, events: List[dict]):
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def merge_traces(paths: Sequence[str], out: str) -> int:
+    """
+    one trace with the events of every dump, each node stays its own process
+    """
+    events = []
+    for path in paths:
+        with open(path, 'r') as f:
+            trace = json.load(f)
+        events.extend(trace['traceEvents'] if isinstance(trace, dict) else trace)
+    events.sort(key=lambda event: event.get('ts', 0))
+    write_trace(out, events)
+    return len(events)
+
+
+if __name__ == '__main__':
+    from cli_io import get_arg
+
+    paths = [arg for arg in sys.argv[1:] if '=' not in arg]
+    out = get_arg('out', cli_fallback=False, default='cluster-trace.json')
+    if not paths:
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(2)
+    print(f"{merge_traces(paths, out)} events from {len(paths)} traces written to {out}")